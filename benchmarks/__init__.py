@@ -0,0 +1 @@
+__all__ = ['synthetic', 'run_benchmarks']
@@ -0,0 +1,381 @@
+"""
+Benchmarks for the processing hot paths, run on synthetic plant registers so that nothing has to be downloaded.
+
+Run them from the repository's root directory, e.g.:
+	python -m benchmarks.run_benchmarks --rows 10000 100000 --output benchmark_results.json
+	python -m benchmarks.run_benchmarks --rows 10000 --baseline benchmark_baseline.json --save-baseline
+	python -m benchmarks.run_benchmarks --rows 10000 --baseline benchmark_baseline.json
+The last command exits with status 1 if a benchmark is slower than in the baseline by more than the tolerance.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_plants, synthetic_value_translation, synthetic_nuts_regions, \
+	write_synthetic_postcode2nuts
+
+COUNTRIES = ['DE', 'FR', 'UK']
+
+
+class NotApplicable(Exception):
+	"""Raised by a benchmark's preparation if the benchmarked step does not exist for the country."""
+
+
+def _synthetic_nuts_converter(country, processes=1):
+	from util.nuts_converter import NUTSConverter
+
+	class SyntheticNUTSConverter(NUTSConverter):
+		# Skip the download of the Eurostat files and use a grid of synthetic regions instead
+		def __init__(self, latlon2nuts, processes=1):
+			self.processes = processes
+			self.country = None
+			self.downloader = None
+			self.postcode2nuts_df = None
+			self.municipality2nuts_df = None
+			self.eurostat_eu_lau2nuts_path = None
+			self.latlon2nuts = latlon2nuts
+
+	return SyntheticNUTSConverter(synthetic_nuts_regions(country), processes)
+
+
+def _translated(df, country):
+	df = df.copy()
+	df.replace(synthetic_value_translation(country), inplace=True)
+	return df
+
+
+def _markers(country):
+	# Representative markers, defined as in validation_and_output.ipynb
+	from util.deduplication import duplicated
+
+	cutoff_date = datetime.date(2017, 12, 31)
+	markers = {
+		'R_3': {'function': lambda df: df['commissioning_date'].isnull()},
+		'R_4': {'function': lambda df: df['electrical_capacity'] <= 0.0},
+		'R_6': {'function': lambda df: df['decommissioning_date'].isnull() == False},
+	}
+	if country == 'DE':
+		markers['R_1'] = {'function': lambda df: df['commissioning_date'].apply(
+				lambda x: isinstance(x, datetime.date) and x <= cutoff_date) &
+			(df['data_source'].isin(['BNetzA', 'BNetzA_PV', 'BNetzA_PV_historic']))}
+		markers['R_2'] = {'function': lambda df: (df['notification_reason'] != 'Inbetriebnahme') &
+			(df['data_source'] == 'BNetzA')}
+		markers['R_8'] = {'function': lambda df: (duplicated(df, ['eeg_id'], keep='first')) &
+			(df['eeg_id'].isnull() == False)}
+	elif country == 'FR':
+		markers['R_7'] = {'function': lambda df: (df['lat'] < 41) | (df['lon'] < -6) | (df['lon'] > 10)}
+	return markers
+
+
+# Each benchmark prepares its input (untimed) and returns the function to be timed.
+
+def prepare_nuts_assignment(df, country, workdir):
+	converter = _synthetic_nuts_converter(country)
+	postcode2nuts_path = write_synthetic_postcode2nuts(df, os.path.join(workdir, 'pc_{}.csv'.format(country)))
+	return lambda: converter.add_nuts_information(df, country, postcode2nuts_path,
+		how=['postcode', 'latlon'], latitude_column='lat', longitude_column='lon')
+
+
+def prepare_parallel_nuts_assignment(df, country, workdir):
+	import multiprocessing
+	from util import nuts_converter
+
+	processes = max(2, multiprocessing.cpu_count())
+	converter = _synthetic_nuts_converter(country, processes=processes)
+
+	# The converter starts the pool only for at least MINIMAL_SERIAL_SECONDS of serial work, which it estimates
+	# from the first SAMPLE_POINTS distinct points. Estimate it the same way and, if df is too small, use a larger
+	# register with 1.5 times that work (not df's plants repeated, as each distinct point is classified only once).
+	sample = df.iloc[:nuts_converter.SAMPLE_POINTS]
+	start = time.perf_counter()
+	nuts_converter._classify_points(converter.latlon2nuts[country], sample['lat'].values, sample['lon'].values, False)
+	seconds_per_point = (time.perf_counter() - start) / max(sample.shape[0], 1)
+	minimal_rows = max(int(1.5 * nuts_converter.MINIMAL_SERIAL_SECONDS / max(seconds_per_point, 1e-9)),
+		nuts_converter.MINIMAL_POINTS_PER_PROCESS * processes) + nuts_converter.SAMPLE_POINTS
+	if df.shape[0] < minimal_rows:
+		df = synthetic_plants(country, minimal_rows)
+
+	function = lambda: converter.add_nuts_information(df.copy(), country, None,
+		how=['latlon'], latitude_column='lat', longitude_column='lon')
+	function.timed_rows = df.shape[0]
+	return function
+
+
+def prepare_value_translation(df, country, workdir):
+	value_dict = synthetic_value_translation(country)
+	return lambda: df.replace(value_dict, inplace=True)
+
+
+def prepare_coordinate_transform(df, country, workdir):
+	# The transform of the country's original coordinates in download_and_process.ipynb:
+	# UTM for DE (as for DK), the British National Grid for UK. SE's SWEREF 99 TM has no synthetic register,
+	# and the French plants are located by their municipality codes, without a transform.
+	if country == 'DE':
+		import utm
+
+		def convert_to_latlon(utm_east, utm_north, utm_zone):
+			try:
+				return utm.to_latlon(utm_east, utm_north, utm_zone, 'U')
+			except:
+				return ''
+
+		columns = df[['utm_east', 'utm_north', 'utm_zone']]
+		return lambda: columns.apply(lambda x: convert_to_latlon(x.iloc[0], x.iloc[1], x.iloc[2]), axis=1)
+	elif country == 'UK':
+		import bng_to_latlon
+
+		columns = df[['easting', 'northing']]
+		return lambda: columns.apply(lambda x: bng_to_latlon.OSGB36toWGS84(x.iloc[0], x.iloc[1]), axis=1)
+	else:
+		raise NotApplicable('{} has no coordinates to transform'.format(country))
+
+
+def prepare_daily_timeseries(df, country, workdir):
+	from util.timeseries import to_daily_timeseries, min_date, max_date
+
+	df = _translated(df, country)
+	start_date = min_date(df['commissioning_date'])
+	end_date = max_date(df['commissioning_date'])
+	return lambda: to_daily_timeseries(df, start_date, end_date)
+
+
+def prepare_capacity_cube(df, country, workdir):
+	from util.capacity_cube import build_cube
+
+	df = _translated(df, country)
+	df['country'] = country
+	# Derive synthetic NUTS regions from the postcodes
+	df['nuts_3_region'] = country + df['postcode'].str[:3]
+	df['nuts_2_region'] = df['nuts_3_region'].str[:4]
+	df['nuts_1_region'] = df['nuts_3_region'].str[:3]
+	return lambda: build_cube(df)
+
+
+def prepare_markers(df, country, workdir):
+	from util.validation import mark
+
+	markers = _markers(country)
+	return lambda: mark(df, markers)
+
+
+def prepare_deduplication(df, country, workdir):
+	from util.deduplication import drop_duplicates
+
+	# Add exact copies of a tenth of the plants, as when the same plants come from several sources
+	df = pd.concat([df, df.sample(frac=0.1, random_state=0)], ignore_index=True)
+	return lambda: drop_duplicates(df, verbose=False)
+
+
+def prepare_spatial_duplicates(df, country, workdir):
+	from util.spatial_duplicates import find_candidates
+
+	# Add a tenth of the plants again, as reported by another source with slightly different values
+	random = np.random.RandomState(0)
+	copies = df.sample(frac=0.1, random_state=0)
+	copies['data_source'] = 'Other source'
+	copies['lat'] += random.uniform(-0.001, 0.001, size=copies.shape[0])
+	copies['lon'] += random.uniform(-0.001, 0.001, size=copies.shape[0])
+	copies['electrical_capacity'] *= random.uniform(0.95, 1.05, size=copies.shape[0])
+	df = pd.concat([df, copies], ignore_index=True)
+	return lambda: find_candidates(df)
+
+
+def prepare_csv_export(df, country, workdir):
+	from util.export import write_csv
+
+	df = _translated(df, country)
+	return lambda: write_csv(df, os.path.join(workdir, 'renewable_power_plants_{}.csv'.format(country)))
+
+
+def prepare_parallel_csv_export(df, country, workdir):
+	import multiprocessing
+	from util.export import write_csv
+
+	df = _translated(df, country)
+	return lambda: write_csv(df, os.path.join(workdir, 'renewable_power_plants_{}.csv'.format(country)),
+		processes=multiprocessing.cpu_count(), compressions=['gz'])
+
+
+def prepare_xlsx_export(df, country, workdir):
+	import xlsxwriter
+	from util.export import write_df_to_excel
+
+	df = _translated(df, country)
+
+	def export():
+		book = xlsxwriter.Workbook(os.path.join(workdir, 'renewable_power_plants_{}.xlsx'.format(country)),
+			{'constant_memory': True})
+		date_format = book.add_format({'num_format': 'yyyy-mm-dd'})
+		column_formats = {'commissioning_date': date_format, 'decommissioning_date': date_format}
+		write_df_to_excel(df, book, 10**6, formats=column_formats, name=country)
+		book.close()
+
+	return export
+
+
+def prepare_sqlite_export(df, country, workdir):
+	import sqlalchemy
+
+	df = _translated(df, country)
+	engine = sqlalchemy.create_engine('sqlite:///' + os.path.join(workdir, 'renewable_power_plants.sqlite'))
+	table_name = 'renewable_power_plants_' + country
+	return lambda: df.to_sql(table_name, engine, if_exists="replace", chunksize=100000, index=False)
+
+
+BENCHMARKS = {
+	'nuts_assignment': prepare_nuts_assignment,
+	'parallel_nuts_assignment': prepare_parallel_nuts_assignment,
+	'value_translation': prepare_value_translation,
+	'coordinate_transform': prepare_coordinate_transform,
+	'daily_timeseries': prepare_daily_timeseries,
+	'capacity_cube': prepare_capacity_cube,
+	'markers': prepare_markers,
+	'deduplication': prepare_deduplication,
+	'spatial_duplicates': prepare_spatial_duplicates,
+	'csv_export': prepare_csv_export,
+	'parallel_csv_export': prepare_parallel_csv_export,
+	'xlsx_export': prepare_xlsx_export,
+	'sqlite_export': prepare_sqlite_export,
+}
+
+
+def time_benchmark(prepare, df, country, workdir, repeat=1):
+	"""
+	Time the function returned by prepare on fresh copies of df.
+	Returns the list of the measured durations in seconds and the number of the rows processed,
+	which is the function's timed_rows if prepare had to enlarge df.
+	"""
+	times = []
+	timed_rows = df.shape[0]
+	for i in range(repeat):
+		function = prepare(df.copy(), country, workdir)
+		timed_rows = getattr(function, 'timed_rows', df.shape[0])
+		# Silence the progress messages of the timed functions
+		with contextlib.redirect_stdout(io.StringIO()):
+			start = time.perf_counter()
+			function()
+			times.append(time.perf_counter() - start)
+	return times, timed_rows
+
+
+def run_benchmarks(rows, countries=COUNTRIES, benchmarks=None, repeat=1, seed=0, workdir=None):
+	"""
+	Run the benchmarks for each country and number of rows and return the results as a dictionary.
+	A benchmark whose dependencies are not installed, or which does not apply to the country, is reported as skipped.
+	"""
+	if benchmarks is None:
+		benchmarks = sorted(BENCHMARKS)
+
+	remove_workdir = workdir is None
+	if workdir is None:
+		workdir = tempfile.mkdtemp(prefix='opsd_benchmarks_')
+
+	results = []
+	try:
+		for number_of_rows in rows:
+			for country in countries:
+				df = synthetic_plants(country, number_of_rows, seed=seed)
+				for name in benchmarks:
+					result = {'benchmark': name, 'country': country, 'rows': number_of_rows}
+					try:
+						times, timed_rows = time_benchmark(BENCHMARKS[name], df, country, workdir, repeat=repeat)
+					except (ImportError, NotApplicable) as error:
+						result['skipped'] = str(error)
+						print('{:<22} {} {:>10} rows: skipped ({})'.format(name, country, number_of_rows, error))
+					else:
+						result['seconds'] = min(times)
+						result['times'] = times
+						if timed_rows != number_of_rows:
+							result['timed_rows'] = timed_rows
+						result['rows_per_second'] = timed_rows / max(min(times), 1e-9)
+						print('{:<22} {} {:>10} rows: {:10.3f} s'.format(name, country, number_of_rows, min(times)))
+					results.append(result)
+	finally:
+		if remove_workdir:
+			shutil.rmtree(workdir, ignore_errors=True)
+
+	return {
+		'created': datetime.datetime.now().isoformat(),
+		'python': platform.python_version(),
+		'pandas': pd.__version__,
+		'numpy': np.__version__,
+		'machine': platform.machine(),
+		'results': results,
+	}
+
+
+def find_regressions(results, baseline, tolerance=0.2):
+	"""
+	Compare the results to the baseline and return the benchmarks which are slower
+	than their baseline by more than the tolerance (0.2 means 20 %).
+	"""
+	def key(result):
+		return (result['benchmark'], result['country'], result['rows'])
+
+	baseline_seconds = {key(result): result['seconds'] for result in baseline['results'] if 'seconds' in result}
+	regressions = []
+	for result in results['results']:
+		if 'seconds' not in result or key(result) not in baseline_seconds:
+			continue
+		reference = baseline_seconds[key(result)]
+		if result['seconds'] > reference * (1 + tolerance):
+			regression = dict(result)
+			regression['baseline_seconds'] = reference
+			regression['slowdown'] = result['seconds'] / max(reference, 1e-9)
+			regressions.append(regression)
+	return regressions
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Benchmark the processing hot paths on synthetic data.')
+	parser.add_argument('--rows', type=int, nargs='+', default=[10000],
+		help='the numbers of rows of the synthetic registers (e.g. 10000 1000000 10000000)')
+	parser.add_argument('--countries', nargs='+', default=COUNTRIES, choices=COUNTRIES)
+	parser.add_argument('--benchmarks', nargs='+', default=sorted(BENCHMARKS), choices=sorted(BENCHMARKS))
+	parser.add_argument('--repeat', type=int, default=1, help='the number of runs per benchmark; the best one counts')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--output', help='the JSON file to write the results to')
+	parser.add_argument('--baseline', help='the JSON file with the baseline results')
+	parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+	parser.add_argument('--tolerance', type=float, default=0.2,
+		help='the allowed slowdown relative to the baseline (0.2 means 20 %%)')
+	args = parser.parse_args(argv)
+
+	results = run_benchmarks(args.rows, countries=args.countries, benchmarks=args.benchmarks,
+		repeat=args.repeat, seed=args.seed)
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(results, f, indent=2)
+
+	if args.baseline and args.save_baseline:
+		with open(args.baseline, 'w') as f:
+			json.dump(results, f, indent=2)
+		print('Baseline saved to', args.baseline)
+	elif args.baseline:
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+		regressions = find_regressions(results, baseline, tolerance=args.tolerance)
+		for regression in regressions:
+			print('REGRESSION {benchmark} {country} {rows} rows: {seconds:.3f} s, baseline {baseline_seconds:.3f} s '
+				'({slowdown:.2f}x)'.format(**regression))
+		if len(regressions) > 0:
+			return 1
+		print('No regressions.')
+
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
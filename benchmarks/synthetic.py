@@ -0,0 +1,183 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+# Rough bounding boxes (min_lon, min_lat, max_lon, max_lat) of the countries
+BOUNDING_BOXES = {
+	'DE': (5.9, 47.3, 15.0, 55.0),
+	'FR': (-4.8, 42.3, 8.2, 51.1),
+	'UK': (-8.2, 49.9, 1.8, 58.7),
+}
+
+# The energy sources as they appear in the original data, before the value translation
+ORIGINAL_ENERGY_SOURCES = {
+	'DE': ['Solarstrom', 'Wind Land', 'Wind See', 'Biomasse', 'Wasserkraft', 'Klärgas', 'Deponiegas', 'Geothermie'],
+	'FR': ['Photovoltaïque', 'Eolien', 'Hydraulique', 'Bioénergies', 'Energies Marines', 'Géothermie'],
+	'UK': ['Solar Photovoltaics', 'Wind Onshore', 'Wind Offshore', 'Hydro', 'Biomass (dedicated)',
+		   'Landfill Gas', 'Anaerobic Digestion', 'Shoreline Wave'],
+}
+
+DATA_SOURCES = {
+	'DE': ['50Hertz', 'Amprion', 'TenneT', 'TransnetBW', 'BNetzA', 'BNetzA_PV', 'BNetzA_PV_historic'],
+	'FR': ['OPEN DATA RESEAUX ENERGIES', 'Ministry for the Ecological and Inclusive Transition'],
+	'UK': ['BEIS'],
+}
+
+STREET_NAMES = ['Hauptstraße', 'Bahnhofstraße', 'Rue de la Gare', 'Grande Rue', 'High Street',
+				'Station Road', 'Church Lane', 'Dorfstraße', 'Avenue Jean Jaurès', 'Mill Lane']
+
+
+def synthetic_value_translation(country, translation_list_path=None):
+	"""
+	Return the value translation dictionary for the country as it is used in the processing notebook.
+	The original names missing from input/value_translation_list.csv are mapped to themselves.
+	"""
+	if translation_list_path is None:
+		translation_list_path = os.path.join(os.path.dirname(__file__), '..', 'input', 'value_translation_list.csv')
+	valuenames = pd.read_csv(translation_list_path)
+	idx = valuenames[valuenames['country'] == country].index
+	value_dict = valuenames.loc[idx].set_index('original_name')['opsd_name'].to_dict()
+	for original_name in ORIGINAL_ENERGY_SOURCES[country]:
+		value_dict.setdefault(original_name, original_name)
+	return value_dict
+
+
+def _random_dates(random, number_of_rows, missing_share=0.02):
+	start = datetime.date(1990, 1, 1).toordinal()
+	end = datetime.date(2019, 12, 31).toordinal()
+	ordinals = random.randint(0, end - start + 1, size=number_of_rows)
+	# Create each date object only once, as there are far fewer days than rows at large scales
+	days = np.array([datetime.date.fromordinal(start + i) for i in range(end - start + 1)], dtype=object)
+	dates = days[ordinals]
+	dates[random.rand(number_of_rows) < missing_share] = np.nan
+	return dates
+
+
+def _random_postcodes(random, country, number_of_rows, number_of_postcodes):
+	if country == 'UK':
+		areas = np.array(['AB', 'B', 'BS', 'CF', 'EH', 'G', 'L', 'M', 'NE', 'SW', 'TR', 'YO'])
+		area = areas[random.randint(0, len(areas), size=number_of_postcodes)]
+		district = random.randint(1, 40, size=number_of_postcodes).astype(str)
+		sector = random.randint(0, 10, size=number_of_postcodes).astype(str)
+		unit = np.array([chr(65 + i) for i in range(26)])
+		unit = unit[random.randint(0, 26, size=(number_of_postcodes, 2))]
+		uniques = np.char.add(np.char.add(np.char.add(area, district), ' '),
+			np.char.add(np.char.add(sector, unit[:, 0]), unit[:, 1]))
+	else:
+		uniques = np.char.zfill(random.randint(1000, 99999, size=number_of_postcodes).astype(str), 5)
+	return uniques[random.randint(0, len(uniques), size=number_of_rows)]
+
+
+def synthetic_plants(country, number_of_rows, seed=0, number_of_postcodes=None):
+	"""
+	Generate a synthetic register of renewable power plants resembling the
+	country's data after the processing (but before the value translation).
+	The energy sources are given by their original names, as in ORIGINAL_ENERGY_SOURCES,
+	so that the value translation can be measured too.
+	"""
+	if country not in BOUNDING_BOXES:
+		raise ValueError('No synthetic data for the country: ' + str(country))
+
+	random = np.random.RandomState(seed)
+	if number_of_postcodes is None:
+		number_of_postcodes = max(10, min(number_of_rows // 20, 50000))
+
+	min_lon, min_lat, max_lon, max_lat = BOUNDING_BOXES[country]
+
+	# Most plants are small photovoltaic installations, so the capacities are log-normally distributed
+	energy_sources = np.array(ORIGINAL_ENERGY_SOURCES[country], dtype=object)
+	weights = np.array([0.7] + [0.3 / (len(energy_sources) - 1)] * (len(energy_sources) - 1))
+	data_sources = np.array(DATA_SOURCES[country], dtype=object)
+
+	postcodes = _random_postcodes(random, country, number_of_rows, number_of_postcodes)
+	municipality_codes = np.char.zfill(random.randint(0, 40000, size=number_of_rows).astype(str), 8)
+	streets = np.array(STREET_NAMES, dtype=object)[random.randint(0, len(STREET_NAMES), size=number_of_rows)]
+
+	df = pd.DataFrame({
+		'electrical_capacity': np.round(random.lognormal(mean=-3, sigma=1.5, size=number_of_rows), 6),
+		'energy_source_level_1': 'Renewable energy',
+		'energy_source_level_2': energy_sources[random.choice(len(energy_sources), size=number_of_rows, p=weights)],
+		'energy_source_level_3': np.nan,
+		'data_source': data_sources[random.randint(0, len(data_sources), size=number_of_rows)],
+		'commissioning_date': _random_dates(random, number_of_rows),
+		'decommissioning_date': _random_dates(random, number_of_rows, missing_share=0.98),
+		'postcode': postcodes,
+		'municipality_code': municipality_codes,
+		'municipality': np.char.add('Municipality ', municipality_codes),
+		'address': streets,
+		'address_number': random.randint(1, 200, size=number_of_rows),
+		'lat': np.round(random.uniform(min_lat, max_lat, size=number_of_rows), 5),
+		'lon': np.round(random.uniform(min_lon, max_lon, size=number_of_rows), 5),
+	})
+	df['technology'] = df['energy_source_level_2']
+
+	# Add the country specific columns
+	if country == 'DE':
+		df['utm_zone'] = 32
+		df['utm_east'] = np.round(random.uniform(280000, 920000, size=number_of_rows), 1)
+		df['utm_north'] = np.round(random.uniform(5240000, 6100000, size=number_of_rows), 1)
+		df['tso'] = np.array(DATA_SOURCES['DE'][:4], dtype=object)[random.randint(0, 4, size=number_of_rows)]
+		df['dso'] = np.char.add('DSO ', random.randint(0, 900, size=number_of_rows).astype(str))
+		df['eeg_id'] = np.char.add('E', np.char.zfill(random.randint(0, number_of_rows, size=number_of_rows).astype(str), 12))
+		df['notification_reason'] = np.where(random.rand(number_of_rows) < 0.95, 'Inbetriebnahme', 'Erweiterung')
+		df['grid_decommissioning_date'] = _random_dates(random, number_of_rows, missing_share=0.99)
+	elif country == 'FR':
+		df['departement'] = np.char.add('Département ', random.randint(1, 96, size=number_of_rows).astype(str))
+		df['region'] = np.char.add('Région ', random.randint(1, 14, size=number_of_rows).astype(str))
+		df['disconnection_date'] = _random_dates(random, number_of_rows, missing_share=0.99)
+		# Some plants are located overseas
+		overseas = random.rand(number_of_rows) < 0.01
+		df.loc[overseas, 'lat'] = 16.25
+		df.loc[overseas, 'lon'] = -61.58
+	elif country == 'UK':
+		df['site_name'] = np.char.add('Site ', np.arange(number_of_rows).astype(str))
+		df['region'] = np.array(['Scotland', 'Wales', 'England', 'Northern Ireland'], dtype=object)[
+			random.randint(0, 4, size=number_of_rows)]
+		df['easting'] = np.round(random.uniform(100000, 650000, size=number_of_rows))
+		df['northing'] = np.round(random.uniform(10000, 1200000, size=number_of_rows))
+
+	return df
+
+
+class SyntheticRegion(object):
+	"""A stand-in for the shapefile records used by NUTSConverter: a geometry and its attributes."""
+	def __init__(self, geometry, attributes):
+		super(SyntheticRegion, self).__init__()
+		self.geometry = geometry
+		self.attributes = attributes
+
+
+def synthetic_nuts_regions(country, rows=10, columns=10):
+	"""
+	Split the country's bounding box into a grid of rectangular NUTS-3 regions,
+	in the format of NUTSConverter.latlon2nuts.
+	"""
+	import shapely.geometry as sgeom
+
+	min_lon, min_lat, max_lon, max_lat = BOUNDING_BOXES[country]
+	lon_step = (max_lon - min_lon) / columns
+	lat_step = (max_lat - min_lat) / rows
+	regions = []
+	for i in range(rows):
+		for j in range(columns):
+			geometry = sgeom.box(min_lon + j * lon_step, min_lat + i * lat_step,
+				min_lon + (j + 1) * lon_step, min_lat + (i + 1) * lat_step)
+			nuts3_code = '{}{}{}'.format(country, chr(65 + i % 26), j)
+			regions.append(SyntheticRegion(geometry, {'CNTR_CODE': country, 'FID': nuts3_code}))
+	return {country: regions}
+
+
+def write_synthetic_postcode2nuts(df, path, postcode_column='postcode', coverage=0.8, seed=0):
+	"""
+	Write a postcode-to-NUTS-3 table for the postcodes of df, in the format of the Eurostat files.
+	Only the given share of the postcodes is covered.
+	"""
+	random = np.random.RandomState(seed)
+	postcodes = pd.Series(df[postcode_column].dropna().unique())
+	postcodes = postcodes[random.rand(len(postcodes)) < coverage]
+	nuts3 = np.char.add('XX', random.randint(0, 400, size=len(postcodes)).astype(str))
+	postcode2nuts_df = pd.DataFrame({'NUTS3': nuts3, 'CODE': postcodes.values})
+	postcode2nuts_df.to_csv(path, sep=';', quotechar="'", index=False)
+	return path
@@ -0,0 +1,179 @@
+"""
+Virtual paths into zip archives, so that the files of the sources can be read directly out of the
+downloaded archives, nested ones included, without extracting them to disk.
+
+A virtual path is the path of an archive followed by the members, each preceded by '!/', e.g.
+	input/original_data/DE/50Hertz/50Hertz.zip!/50Hertz Stammdaten.csv
+	input/eurostat_eu/ref-nuts-2016-01m.shp.zip!/NUTS_RG_01M_2016_4326_LEVL_3.shp.zip!/NUTS_RG_01M_2016_4326_LEVL_3.shp
+Nested archives are decompressed in memory. The most recently used ones are kept in a cache, keyed by
+their content hash (CRC-32 and size from the archive's directory), so reading several members of the
+same nested archive decompresses it only once.
+"""
+import collections
+import io
+import os
+import zipfile
+
+SEPARATOR = '!/'
+
+# The maximal total size of the nested archives kept in memory
+CACHE_SIZE = 512 * 1024 * 1024
+
+_cache = collections.OrderedDict()
+_cache_size = 0
+
+
+def join_path(path, *members):
+	"""Return the virtual path of the members (nested in that order) of the archive at path."""
+	return SEPARATOR.join([path] + list(members))
+
+
+def split_path(path):
+	"""Split the virtual path into the path of the file on disk and the list of the members nested in it."""
+	parts = path.split(SEPARATOR)
+	return parts[0], parts[1:]
+
+
+def is_virtual(path):
+	return SEPARATOR in path
+
+
+def _cache_key(info):
+	return '{:08x}-{}'.format(info.CRC, info.file_size)
+
+
+def _read_nested(archive, member):
+	# Return the bytes of the member, from the cache if it is there
+	global _cache_size
+
+	info = archive.getinfo(member)
+	key = _cache_key(info)
+	if key in _cache:
+		_cache.move_to_end(key)
+		return _cache[key]
+
+	content = archive.read(info)
+	if len(content) <= CACHE_SIZE:
+		_cache[key] = content
+		_cache_size += len(content)
+		while _cache_size > CACHE_SIZE:
+			_, evicted = _cache.popitem(last=False)
+			_cache_size -= len(evicted)
+	return content
+
+
+def clear_cache():
+	global _cache_size
+	_cache.clear()
+	_cache_size = 0
+
+
+def _open_archive(filepath, archives):
+	# Open the archive containing the last member of the path; the archives opened on the way are added to archives
+	filepath, members = split_path(filepath)
+	archive = zipfile.ZipFile(filepath)
+	archives.append(archive)
+	for member in members[:-1]:
+		archive = zipfile.ZipFile(io.BytesIO(_read_nested(archive, member)))
+		archives.append(archive)
+	return archive, members[-1] if len(members) > 0 else None
+
+
+class _MemberFile(object):
+	# A member of an archive opened for reading, which closes the archives containing it when closed
+
+	def __init__(self, stream, archives):
+		self.__stream = stream
+		self.__archives = archives
+
+	def __getattr__(self, name):
+		return getattr(self.__stream, name)
+
+	def __iter__(self):
+		return iter(self.__stream)
+
+	def close(self):
+		self.__stream.close()
+		for archive in reversed(self.__archives):
+			archive.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+
+def open_file(path, mode='rb', encoding=None):
+	"""
+	Open the file at the virtual or plain path for reading.
+	Use mode 'r' (with an encoding) for text and 'rb' for bytes.
+	"""
+	if not is_virtual(path):
+		return open(path, mode, encoding=encoding) if 'b' not in mode else open(path, mode)
+
+	archives = []
+	try:
+		archive, member = _open_archive(path, archives)
+		stream = archive.open(member)
+		if 'b' not in mode:
+			stream = io.TextIOWrapper(stream, encoding=encoding)
+	except:
+		for archive in archives:
+			archive.close()
+		raise
+	return _MemberFile(stream, archives)
+
+
+def list_members(path):
+	"""Return the names of the members of the archive at the virtual or plain path."""
+	archives = []
+	try:
+		archive, member = _open_archive(join_path(path, ''), archives)
+		return [name for name in archive.namelist() if not name.endswith('/')]
+	finally:
+		for archive in archives:
+			archive.close()
+
+
+def is_archive(path):
+	"""Check if the file at the virtual or plain path is a zip archive."""
+	if not is_virtual(path):
+		return zipfile.is_zipfile(path)
+	with open_file(path) as f:
+		return zipfile.is_zipfile(io.BytesIO(f.read()))
+
+
+def exists(path):
+	"""Check if the file at the virtual or plain path exists."""
+	filepath, members = split_path(path)
+	if len(members) == 0:
+		return os.path.exists(filepath)
+	if not os.path.exists(filepath):
+		return False
+	parent = join_path(filepath, *members[:-1])
+	try:
+		return members[-1] in list_members(parent)
+	except (KeyError, zipfile.BadZipFile):
+		return False
+
+
+def extract(path, directory_path):
+	"""
+	Extract all the members of the archive at the virtual or plain path into the directory
+	(e.g. for libraries which can only read files on disk), unless they have already been extracted.
+	Returns the directory path.
+	"""
+	archives = []
+	try:
+		archive, _ = _open_archive(join_path(path, ''), archives)
+		os.makedirs(directory_path, exist_ok=True)
+		for info in archive.infolist():
+			target = os.path.join(directory_path, info.filename)
+			if info.filename.endswith('/') or (os.path.exists(target) and os.path.getsize(target) == info.file_size):
+				continue
+			archive.extract(info, directory_path)
+	finally:
+		for archive in archives:
+			archive.close()
+	return directory_path
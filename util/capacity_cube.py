@@ -0,0 +1,146 @@
+"""
+A precomputed cube of the cumulative installed capacity and number of plants
+per country, NUTS region (at each level), energy type and month.
+
+The cube is built in one pass over the plants and stored sparsely: there is a row only for the months
+in which plants were commissioned, with the capacity and number of plants added in that month and the
+cumulative values up to and including it. For the months without a row, the values of the last
+preceding row hold. At NUTS level 0, the region is the country itself.
+
+	cube = CapacityCube.from_df(european_df)
+	cube.to_csv(os.path.join(package_path, 'renewable_capacity_cube.csv'))
+	cube.at('2015-06', country='DE', nuts_level=2, region='DE21', energy_type='solar')
+	cube.rollup(by=['country'], energy_type=['wind_onshore', 'wind_offshore'])
+"""
+import numpy as np
+import pandas as pd
+
+from .export import write_csv
+from .instrumentation import instrumented
+from .timeseries import energy_types
+
+NUTS_COLUMNS = {1: 'nuts_1_region', 2: 'nuts_2_region', 3: 'nuts_3_region'}
+
+DIMENSIONS = ['country', 'nuts_level', 'region', 'energy_type']
+VALUE_COLUMNS = ['capacity_added', 'plants_added', 'cumulative_capacity', 'cumulative_plants']
+CUBE_COLUMNS = DIMENSIONS + ['month'] + VALUE_COLUMNS
+
+
+def _months(values):
+	# The first day of the month of each date
+	return pd.to_datetime(values, errors='coerce').values.astype('datetime64[M]').astype('datetime64[ns]')
+
+
+def _accumulate(cube, by):
+	# Sort the rows and add the cumulative values per group of the by columns
+	cube = cube.sort_values(by + ['month']).reset_index(drop=True)
+	cumulative = cube.groupby(by, sort=False)[['capacity_added', 'plants_added']].cumsum()
+	cube['cumulative_capacity'] = cumulative['capacity_added'].values
+	cube['cumulative_plants'] = cumulative['plants_added'].values
+	return cube
+
+
+@instrumented('capacity_cube', rows_argument='df')
+def build_cube(df, capacity_column='electrical_capacity', date_column='commissioning_date'):
+	"""
+	Build the cube from the plants in df, which must have the columns country, energy_source_level_2, technology,
+	the capacity and date columns and (optionally) the NUTS columns.
+	The plants without a valid date or an energy type are left out, as in the capacity timeseries,
+	and the plants without a region only count at the levels where they have one.
+	"""
+	months = _months(df[date_column])
+	labels = energy_types(df).values
+	known = ~np.isnat(months) & pd.notnull(labels)
+	plants = df.loc[known]
+
+	base = pd.DataFrame({
+		'country': plants['country'].values,
+		'energy_type': labels[known],
+		'month': months[known],
+		'capacity_added': pd.to_numeric(plants[capacity_column], errors='coerce').fillna(0).values,
+		'plants_added': 1,
+	})
+	# An empty string marks the missing regions, as groupby leaves out missing keys
+	for column in NUTS_COLUMNS.values():
+		base[column] = plants[column].fillna('').values if column in plants.columns else ''
+
+	# Aggregate the plants to the finest cells once; the coarser levels are rolled up from them
+	finest = ['country'] + list(NUTS_COLUMNS.values()) + ['energy_type', 'month']
+	base = base.groupby(finest)[['capacity_added', 'plants_added']].sum().reset_index()
+
+	parts = []
+	for level in [0] + sorted(NUTS_COLUMNS):
+		by = ['country'] + ([NUTS_COLUMNS[level]] if level > 0 else [])
+		part = base.groupby(by + ['energy_type', 'month'])[['capacity_added', 'plants_added']].sum().reset_index()
+		part['region'] = part[NUTS_COLUMNS[level]] if level > 0 else part['country']
+		part['nuts_level'] = level
+		parts.append(part.loc[part['region'] != ''])
+
+	cube = pd.concat(parts, ignore_index=True, sort=False)
+	cube['plants_added'] = cube['plants_added'].astype(np.int64)
+	return _accumulate(cube, DIMENSIONS)[CUBE_COLUMNS]
+
+
+class CapacityCube(object):
+	"""The capacity cube (see build_cube) with lookups along its dimensions."""
+	def __init__(self, cube):
+		super(CapacityCube, self).__init__()
+		self.cube = cube
+
+	@classmethod
+	def from_df(cls, df, capacity_column='electrical_capacity', date_column='commissioning_date'):
+		return cls(build_cube(df, capacity_column=capacity_column, date_column=date_column))
+
+	@classmethod
+	def from_csv(cls, path):
+		"""Read the cube written by to_csv (e.g. renewable_capacity_cube.csv from the data package)."""
+		cube = pd.read_csv(path, dtype={'country': str, 'region': str, 'energy_type': str},
+						   parse_dates=['month'], keep_default_na=False, na_values=[''])
+		return cls(cube)
+
+	def to_csv(self, path):
+		write_csv(self.cube, path, float_format='%.3f')
+
+	def slice(self, start=None, end=None, **filters):
+		"""
+		Return the rows of the cube matching the filters, which are dimension=value or dimension=[values]
+		for the DIMENSIONS, and the months between start and end (inclusive, either can be None).
+		"""
+		mask = np.ones(self.cube.shape[0], dtype=bool)
+		for dimension, values in filters.items():
+			if dimension not in DIMENSIONS:
+				raise ValueError('The cube has no dimension {}.'.format(dimension))
+			if isinstance(values, str) or not hasattr(values, '__iter__'):
+				values = [values]
+			mask &= self.cube[dimension].isin(values).values
+		if start is not None:
+			mask &= (self.cube['month'] >= pd.Timestamp(start)).values
+		if end is not None:
+			mask &= (self.cube['month'] <= pd.Timestamp(end)).values
+		return self.cube.loc[mask]
+
+	def rollup(self, by=('country',), nuts_level=0, start=None, end=None, **filters):
+		"""
+		Aggregate the cube at the given NUTS level over all the dimensions which are not in by
+		(e.g. over the energy types, for by=['country']), for the rows matching the filters.
+		The cumulative values are computed before the months are restricted to [start, end].
+		"""
+		by = list(by)
+		rows = self.slice(nuts_level=nuts_level, **filters)
+		rolled = rows.groupby(by + ['month'])[['capacity_added', 'plants_added']].sum().reset_index()
+		rolled = _accumulate(rolled, by)
+		if start is not None:
+			rolled = rolled.loc[rolled['month'] >= pd.Timestamp(start)]
+		if end is not None:
+			rolled = rolled.loc[rolled['month'] <= pd.Timestamp(end)]
+		return rolled.reset_index(drop=True)
+
+	def at(self, month, by=('country',), nuts_level=0, **filters):
+		"""
+		Return the cumulative capacity and number of plants at the end of the given month,
+		per group of the by columns, for the rows matching the filters.
+		"""
+		rolled = self.rollup(by=by, nuts_level=nuts_level, end=pd.Timestamp(month).to_period('M').to_timestamp(),
+							 **filters)
+		# The last row of each group is the state at the end of the month
+		return rolled.groupby(list(by))[['cumulative_capacity', 'cumulative_plants']].last()
@@ -0,0 +1,167 @@
+"""
+Command-line runner for the pipeline, so that it can be run without Jupyter, e.g. as a scheduled job.
+Run it from the repository's root directory:
+	python -m util download [--countries DE FR EU]
+	python -m util process DE [--sample 0.01]
+	python -m util validate [--countries DE FR]
+	python -m util export [--countries DE FR]
+process runs the setup and the country's section of download_and_process.ipynb,
+validate runs validation_and_output.ipynb up to its output section, and export runs all of it.
+Heavy modules are imported only by the subcommands that need them.
+"""
+import argparse
+import os
+import re
+import sys
+
+DOWNLOAD_AND_PROCESS_NOTEBOOK = 'download_and_process.ipynb'
+VALIDATION_AND_OUTPUT_NOTEBOOK = 'validation_and_output.ipynb'
+
+# The titles of the countries' sections in download_and_process.ipynb
+COUNTRY_SECTIONS = {
+	'DE': 'Germany DE',
+	'DK': 'Denmark DK',
+	'FR': 'France FR',
+	'PL': 'Poland PL',
+	'CH': 'Switzerland CH',
+	'UK': 'United Kingdom UK',
+	'SE': 'Sweden',
+	'CZ': 'Czech Republic',
+}
+
+# The sections of download_and_process.ipynb which have to run before any country's section
+SETUP_SECTIONS = ['Script setup', 'Settings']
+
+MIRROR_HELP = 'the directory or URL of the mirror of the original files; ' + \
+	'required with --download-from mirror, otherwise a local mirror is filled with the downloaded files'
+
+input_directory_path = os.path.join('input', 'original_data')
+eurostat_eu_directory_path = os.path.join('input', 'eurostat_eu')
+source_list_filepath = os.path.join('input', 'sources.csv')
+
+
+def read_version():
+	"""Read the version set in the first cells of download_and_process.ipynb."""
+	from .notebook_runner import read_cells
+
+	for headings, source in read_cells(DOWNLOAD_AND_PROCESS_NOTEBOOK):
+		match = re.search(r"^version\s*=\s*'([^']+)'", source, re.MULTILINE)
+		if match:
+			return match.group(1)
+	raise ValueError('The version is not set in ' + DOWNLOAD_AND_PROCESS_NOTEBOOK)
+
+
+def download(args):
+	from .downloader import Downloader
+
+	version = args.version if args.version is not None else read_version()
+	downloader = Downloader(version, input_directory_path, source_list_filepath, args.download_from, args.mirror)
+
+	countries = args.countries
+	if countries is None:
+		countries = sorted(downloader.source_df['country'].unique())
+
+	for country in countries:
+		print('Downloading the data for', country)
+		# The files used for the NUTS assignment are stored separately, as in NUTSConverter
+		if country == 'EU':
+			downloader.set_input_directory_path(eurostat_eu_directory_path)
+		downloader.download_data_for_country(country)
+		downloader.set_input_directory_path(input_directory_path)
+
+
+def process(args):
+	from .notebook_runner import read_cells, run_cells
+
+	if args.country not in COUNTRY_SECTIONS:
+		raise ValueError('Unknown country: {}. Choose one of: {}'.format(args.country, ', '.join(COUNTRY_SECTIONS)))
+	section = COUNTRY_SECTIONS[args.country]
+
+	cells = [
+		(headings, source) for headings, source in read_cells(DOWNLOAD_AND_PROCESS_NOTEBOOK)
+		if headings.get(1) is None or headings.get(1) in SETUP_SECTIONS or headings.get(2) == section
+	]
+	overrides = {}
+	if args.version is not None:
+		overrides['version'] = args.version
+	if args.download_from is not None:
+		overrides['download_from'] = args.download_from
+	if args.mirror is not None:
+		overrides['mirror_path'] = args.mirror
+	if args.previous_release is not None:
+		overrides['previous_release'] = args.previous_release
+	if args.sample is not None:
+		overrides['sample_fraction'] = args.sample
+	run_cells(cells, overrides=overrides, name=DOWNLOAD_AND_PROCESS_NOTEBOOK)
+
+
+def validate(args, until_output=True):
+	from .notebook_runner import read_cells, run_cells
+
+	cells = read_cells(VALIDATION_AND_OUTPUT_NOTEBOOK)
+	if until_output:
+		output_cells = [i for i, (headings, source) in enumerate(cells) if headings.get(1) == 'Output']
+		if len(output_cells) > 0:
+			cells = cells[:output_cells[0]]
+
+	overrides = {}
+	if args.countries is not None:
+		overrides['countries'] = args.countries
+	run_cells(cells, overrides=overrides, name=VALIDATION_AND_OUTPUT_NOTEBOOK)
+
+
+def export(args):
+	validate(args, until_output=False)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='python -m util', description='Run the renewable power plants pipeline.')
+	parser.add_argument('--report', help='record the time and memory used by the stages and write the report to this JSON file')
+	subparsers = parser.add_subparsers(dest='command')
+
+	download_parser = subparsers.add_parser('download', help='download the original data')
+	download_parser.add_argument('--countries', nargs='+', help='the countries to download the data for (default: all, including EU)')
+	download_parser.add_argument('--version', help='the version of the data package (default: the one set in ' + DOWNLOAD_AND_PROCESS_NOTEBOOK + ')')
+	download_parser.add_argument('--download-from', default='original_sources', choices=['original_sources', 'opsd_server', 'mirror'])
+	download_parser.add_argument('--mirror', help=MIRROR_HELP)
+	download_parser.set_defaults(function=download)
+
+	process_parser = subparsers.add_parser('process', help='download and process the data for one country')
+	process_parser.add_argument('country', choices=sorted(COUNTRY_SECTIONS))
+	process_parser.add_argument('--version', help='the version of the data package (default: the one set in the notebook)')
+	process_parser.add_argument('--download-from', choices=['original_sources', 'opsd_server', 'mirror'],
+		help='where to download the data from (default: the one set in the notebook)')
+	process_parser.add_argument('--mirror', help=MIRROR_HELP)
+	process_parser.add_argument('--previous-release',
+		help='the directory or URL of the previous release, to process only the plants which changed since it')
+	process_parser.add_argument('--sample', type=float, metavar='FRACTION',
+		help='process only a stratified sample of this fraction of the plants of each source, e.g. 0.01')
+	process_parser.set_defaults(function=process)
+
+	validate_parser = subparsers.add_parser('validate', help='validate and harmonize the processed data')
+	validate_parser.add_argument('--countries', nargs='+', help='the countries to validate (default: the ones set in the notebook)')
+	validate_parser.set_defaults(function=validate)
+
+	export_parser = subparsers.add_parser('export', help='validate the processed data and write the data package')
+	export_parser.add_argument('--countries', nargs='+', help='the countries to export (default: the ones set in the notebook)')
+	export_parser.set_defaults(function=export)
+
+	args = parser.parse_args(argv)
+	if args.command is None:
+		parser.print_help()
+		return 1
+
+	# Plots cannot be shown without a display, so render them off-screen
+	os.environ.setdefault('MPLBACKEND', 'Agg')
+
+	if args.report is not None:
+		from . import instrumentation
+		instrumentation.enable()
+
+	args.function(args)
+
+	if args.report is not None:
+		instrumentation.write_report(args.report)
+		print('Run report written to', args.report)
+
+	return 0
@@ -0,0 +1,132 @@
+"""
+Row fingerprints for removing duplicate plants.
+
+A fingerprint is a 64-bit hash of a row, computed column by column from the factorized values:
+only the unique values of a column are hashed and their hashes are broadcast to the rows by the codes.
+Once computed and stored in the column FINGERPRINT_COLUMN (see add_fingerprint), finding duplicates within
+a table or overlaps between tables are operations on integers. Equal fingerprints only select the candidates:
+values which differ can hash alike (e.g. 8000 and '8000'), so the candidate rows are then compared by value.
+"""
+import numpy as np
+import pandas as pd
+
+FINGERPRINT_COLUMN = 'row_fingerprint'
+
+# The hash of a missing value
+_NAN_HASH = np.uint64(0x9e3779b97f4a7c15)
+_MULTIPLIER = np.uint64(0x100000001b3)
+
+
+def _column_hashes(values):
+	codes, uniques = pd.factorize(values, sort=False)
+	unique_hashes = pd.util.hash_array(np.asarray(uniques))
+	# Code -1 stands for the missing values, so the hash at the last position is used for them
+	unique_hashes = np.append(unique_hashes, _NAN_HASH)
+	return unique_hashes[codes]
+
+
+def fingerprint(df, columns=None):
+	"""
+	Return the 64-bit fingerprints of the rows of df, computed from the given columns
+	(by default, all the columns except FINGERPRINT_COLUMN). Rows with equal values have equal fingerprints,
+	in all the dataframes, as long as the columns are the same and in the same order.
+	"""
+	columns = _compared_columns(df, columns)
+
+	fingerprints = np.zeros(df.shape[0], dtype=np.uint64)
+	with np.errstate(over='ignore'):
+		for column in columns:
+			# Mix in the column name so that swapping the values of two columns changes the fingerprint
+			name_hash = pd.util.hash_array(np.array([str(column)], dtype=object))[0]
+			fingerprints = (fingerprints ^ _column_hashes(df[column].values) ^ name_hash) * _MULTIPLIER
+	return fingerprints
+
+
+def add_fingerprint(df, columns=None):
+	"""
+	Compute the fingerprints of the rows of df and store them in its column FINGERPRINT_COLUMN,
+	where duplicated, drop_duplicates and overlap find them when they compare all the columns.
+	As the stored fingerprints only select the candidates, columns added later (e.g. the markers' comment)
+	need not be covered by them, but they must be recomputed after the values of the covered columns change.
+	"""
+	df[FINGERPRINT_COLUMN] = fingerprint(df, columns)
+	return df
+
+
+def _compared_columns(df, columns):
+	if columns is None:
+		return [column for column in df.columns if column != FINGERPRINT_COLUMN]
+	return list(columns)
+
+
+def _fingerprints_of(df, columns):
+	# Use the stored fingerprints when all the columns are compared
+	if columns is None and FINGERPRINT_COLUMN in df.columns:
+		return df[FINGERPRINT_COLUMN].values
+	return fingerprint(df, columns)
+
+
+def duplicated(df, columns=None, keep='first'):
+	"""
+	Like DataFrame.duplicated, but computed from the row fingerprints (the stored ones, if all the columns
+	are compared). keep can be 'first' or 'last'.
+	"""
+	fingerprints = _fingerprints_of(df, columns)
+	columns = _compared_columns(df, columns)
+	mask = np.zeros(df.shape[0], dtype=bool)
+
+	# Only the rows sharing their fingerprint with another row can be duplicates. Equal fingerprints
+	# do not prove equal values (e.g. 8000 and '8000' hash alike), so these rows are compared by pandas.
+	candidates = np.flatnonzero(pd.Series(fingerprints).duplicated(keep=False).values)
+	if len(candidates) > 0:
+		mask[candidates] = df[columns].iloc[candidates].duplicated(keep=keep).values
+
+	return pd.Series(mask, index=df.index)
+
+
+def report_duplicates(df, mask, source_column='data_source'):
+	"""Return the number of the duplicates marked in mask per source."""
+	if source_column not in df.columns:
+		return pd.Series([int(mask.sum())], index=['all'])
+	return df.loc[mask, source_column].fillna('unknown').value_counts()
+
+
+def drop_duplicates(df, columns=None, keep='first', source_column='data_source', verbose=True):
+	"""
+	Like DataFrame.drop_duplicates, but computed from the row fingerprints.
+	If verbose, print how many duplicates were dropped from which source.
+	Returns the dataframe without the duplicates.
+	"""
+	mask = duplicated(df, columns, keep=keep)
+	if verbose:
+		counts = report_duplicates(df, mask.values, source_column)
+		print('\tDropped {} duplicates out of {} rows.'.format(int(mask.sum()), df.shape[0]))
+		for source, count in counts.items():
+			print('\t\t{}: {}'.format(source, count))
+	return df.loc[~mask.values].copy()
+
+
+def overlap(df, other_df, columns=None):
+	"""
+	Return a boolean mask of the rows of df which are also in other_df (compared by the given columns,
+	by default the columns of df). If all the columns are compared and both dataframes have stored fingerprints,
+	those are used; they must have been computed from the same columns.
+	"""
+	if columns is None and FINGERPRINT_COLUMN in df.columns and FINGERPRINT_COLUMN in other_df.columns:
+		fingerprints = df[FINGERPRINT_COLUMN].values
+		other_fingerprints = other_df[FINGERPRINT_COLUMN].values
+	else:
+		fingerprints = fingerprint(df, _compared_columns(df, columns))
+		other_fingerprints = fingerprint(other_df, _compared_columns(df, columns))
+	columns = _compared_columns(df, columns)
+	mask = np.isin(fingerprints, other_fingerprints)
+
+	# Compare the values of the candidate rows with those of the other rows with the same fingerprints.
+	# As objects, 8000 and '8000' stay different, and the missing values match each other, as in duplicated.
+	positions = np.flatnonzero(mask)
+	if len(positions) > 0:
+		other_positions = np.flatnonzero(np.isin(other_fingerprints, fingerprints[positions]))
+		other_rows = other_df[columns].iloc[other_positions].astype(object).drop_duplicates()
+		matched = df[columns].iloc[positions].astype(object).merge(other_rows, on=columns, how='left', indicator=True)
+		mask[positions] = (matched['_merge'] == 'both').values
+	return pd.Series(mask, index=df.index)
@@ -0,0 +1,268 @@
+"""
+Release-to-release delta processing: compare the new data of a country with the tables published
+in the previous release, so that the expensive steps (e.g. the NUTS assignment) run only for the
+new and changed plants, and write a changelog of the added, removed and modified plants.
+"""
+import datetime
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# The columns identifying a plant across releases
+PLANT_KEYS = {
+	'DE': ['eeg_id'],
+	'DK': ['gsrn_id'],
+	'UK': ['uk_beis_id'],
+	'SE': ['se_vindbrukskollen_id'],
+}
+
+# The columns added by the NUTS assignment
+NUTS_COLUMNS = ['nuts_1_region', 'nuts_2_region', 'nuts_3_region']
+
+
+def read_previous_release(release_path, country):
+	"""
+	Read the country's plants published in the release at release_path (a directory or a URL),
+	including the plants separated by the validation, if any.
+	"""
+	join = os.path.join if os.path.isdir(release_path) else lambda *parts: '/'.join(parts)
+	paths = [
+		join(release_path, 'renewable_power_plants_{}.csv'.format(country)),
+		join(release_path, 'res_plants_separated_{}_outvalidated_plants.csv'.format(country)),
+	]
+
+	dfs = []
+	for i, path in enumerate(paths):
+		try:
+			dfs.append(pd.read_csv(path, dtype=str, keep_default_na=False, na_values=['']))
+		except (IOError, OSError):
+			# Only the main table has to exist
+			if i == 0:
+				raise
+	df = pd.concat(dfs, sort=False, ignore_index=True)
+	if 'comment' in df.columns:
+		df.drop('comment', axis='columns', inplace=True)
+	return df
+
+
+def canonical_columns(new_df, previous_df, columns):
+	"""
+	Convert the given columns of both dataframes to comparable strings, as the new data is typed,
+	but the previous release is read from csv. Numbers are rounded to 6 decimals, dates
+	(the columns whose name ends with '_date') are formatted as yyyy-mm-dd, and line breaks
+	and surrounding whitespace are removed from strings.
+	"""
+	new_canonical = pd.DataFrame(index=new_df.index)
+	previous_canonical = pd.DataFrame(index=previous_df.index)
+	for column in columns:
+		new_values = new_df[column]
+		previous_values = previous_df[column]
+		if column.endswith('_date'):
+			converted = [pd.to_datetime(values, errors='coerce').dt.strftime('%Y-%m-%d')
+						 for values in [new_values, previous_values]]
+		else:
+			numbers = [pd.to_numeric(values, errors='coerce') for values in [new_values, previous_values]]
+			if all((number.notnull() == values.notnull()).all()
+				   for number, values in zip(numbers, [new_values, previous_values])):
+				converted = [number.round(6).astype(str) for number in numbers]
+			else:
+				converted = [values.astype(str).where(values.notnull())
+							 .str.replace('[\r\n]', '', regex=True).str.strip()
+							 for values in [new_values, previous_values]]
+		new_canonical[column] = converted[0].fillna('')
+		previous_canonical[column] = converted[1].fillna('')
+	return new_canonical, previous_canonical
+
+
+def fingerprints(canonical_df):
+	"""Return a 64-bit hash of each row of the canonical dataframe."""
+	if canonical_df.shape[1] == 0:
+		return np.zeros(canonical_df.shape[0], dtype=np.uint64)
+	return pd.util.hash_pandas_object(canonical_df, index=False).values
+
+
+class ReleaseDelta(object):
+	"""
+	The differences between the new plants of a country and the plants published in the previous release.
+
+	Plants are matched by their keys (see PLANT_KEYS) where those are present and unique,
+	and by the fingerprint of their compared columns otherwise.
+	The compared columns are the columns present in both dataframes, except for the derived ones
+	(e.g. the NUTS regions), whose values for the unchanged plants are taken from the previous release.
+	published_names maps the columns of new_df which are renamed before the publication
+	(e.g. the UK's latitude and longitude) to their published names, so that they are compared too.
+	"""
+	def __init__(self, new_df, previous_df, keys=None, derived_columns=NUTS_COLUMNS, country=None,
+		previous_release=None, published_names=None):
+		super(ReleaseDelta, self).__init__()
+		self.country = country
+		self.previous_release = previous_release
+		self.previous_df = previous_df.reset_index(drop=True)
+		new_df = new_df.rename(columns=published_names or {})
+		self.keys = [key for key in (keys or []) if key in new_df.columns and key in previous_df.columns]
+		self.derived_columns = [column for column in derived_columns if column in previous_df.columns]
+		self.compared_columns = [column for column in new_df.columns
+								 if column in previous_df.columns and column not in self.derived_columns]
+
+		new_canonical, previous_canonical = canonical_columns(new_df.reset_index(drop=True), self.previous_df,
+			self.compared_columns)
+		new_fingerprints = fingerprints(new_canonical)
+		previous_fingerprints = fingerprints(previous_canonical)
+
+		# previous_positions[i] is the position of the previous plant matched to the new plant i, or -1
+		number_of_rows = new_df.shape[0]
+		self.previous_positions = np.full(number_of_rows, -1, dtype=np.int64)
+
+		# Match the plants by their keys
+		keyed = np.zeros(number_of_rows, dtype=bool)
+		previous_keyed = np.zeros(self.previous_df.shape[0], dtype=bool)
+		self.new_keys = None
+		self.previous_keys = None
+		if len(self.keys) > 0:
+			new_key_values = new_canonical[self.keys].agg('|'.join, axis=1) if len(self.keys) > 1 \
+				else new_canonical[self.keys[0]]
+			previous_key_values = previous_canonical[self.keys].agg('|'.join, axis=1) if len(self.keys) > 1 \
+				else previous_canonical[self.keys[0]]
+			self.new_keys = new_key_values.values
+			self.previous_keys = previous_key_values.values
+			keyed = ((new_key_values != '') & ~new_key_values.duplicated(keep=False)).values
+			previous_keyed = ((previous_key_values != '') & ~previous_key_values.duplicated(keep=False)).values
+			previous_key_positions = pd.Series(np.flatnonzero(previous_keyed),
+				index=previous_key_values.values[previous_keyed])
+			matched = previous_key_positions.reindex(new_key_values.values[keyed])
+			self.previous_positions[np.flatnonzero(keyed)] = matched.fillna(-1).astype(np.int64).values
+
+		# Match the other plants by their fingerprints
+		previous_fingerprint_positions = pd.Series(np.flatnonzero(~previous_keyed),
+			index=previous_fingerprints[~previous_keyed])
+		previous_fingerprint_positions = previous_fingerprint_positions[
+			~previous_fingerprint_positions.index.duplicated(keep='first')]
+		matched = previous_fingerprint_positions.reindex(new_fingerprints[~keyed])
+		self.previous_positions[np.flatnonzero(~keyed)] = matched.fillna(-1).astype(np.int64).values
+
+		matched = self.previous_positions >= 0
+		same_fingerprint = np.zeros(number_of_rows, dtype=bool)
+		same_fingerprint[matched] = new_fingerprints[matched] == previous_fingerprints[self.previous_positions[matched]]
+
+		self.unchanged_mask = matched & same_fingerprint
+		self.modified_mask = matched & ~same_fingerprint
+		self.added_mask = ~matched
+		self.removed_positions = np.setdiff1d(np.arange(self.previous_df.shape[0]),
+			self.previous_positions[matched])
+
+		# Remember which columns changed for the modified plants
+		modified = np.flatnonzero(self.modified_mask)
+		previous_modified = self.previous_positions[modified]
+		self.modified_columns = [
+			[column for column in self.compared_columns
+			 if new_canonical[column].values[i] != previous_canonical[column].values[j]]
+			for i, j in zip(modified, previous_modified)
+		]
+
+	@classmethod
+	def from_previous_release(cls, new_df, release_path, country, **kwargs):
+		"""Compare new_df with the country's plants published in the release at release_path."""
+		kwargs.setdefault('keys', PLANT_KEYS.get(country))
+		previous_df = read_previous_release(release_path, country)
+		return cls(new_df, previous_df, country=country, previous_release=release_path, **kwargs)
+
+	def summary(self):
+		return {
+			'unchanged': int(self.unchanged_mask.sum()),
+			'modified': int(self.modified_mask.sum()),
+			'added': int(self.added_mask.sum()),
+			'removed': int(len(self.removed_positions)),
+		}
+
+	def apply(self, df, function, *args, **kwargs):
+		"""
+		Call function(changed_df, *args, **kwargs) only for the new and modified plants of df,
+		which must contain the same rows in the same order as the new_df the delta was computed for.
+		function must return the changed plants with the derived columns added (e.g. add_nuts_information).
+		For the unchanged plants, the derived columns are taken from the previous release.
+		Returns all the plants in their original order.
+		"""
+		position_column = '__delta_position'
+		df = df.reset_index(drop=True)
+		df[position_column] = np.arange(df.shape[0])
+
+		changed_df = df[~self.unchanged_mask]
+		print('Processing {} new or modified plants, reusing {} unchanged plants from the previous release.'.format(
+			changed_df.shape[0], int(self.unchanged_mask.sum())))
+		processed_df = function(changed_df, *args, **kwargs)
+
+		reused_df = df[self.unchanged_mask].copy()
+		for column in self.derived_columns:
+			reused_df[column] = self.previous_df[column].values[self.previous_positions[self.unchanged_mask]]
+
+		result = pd.concat([reused_df, processed_df], sort=False)
+		result = result.sort_values(position_column, kind='mergesort')
+		result.drop(position_column, axis='columns', inplace=True)
+		result.reset_index(drop=True, inplace=True)
+		return result
+
+	def __plant_ids(self, positions, keys):
+		# Identify the plants by their keys if they have them, otherwise by their position in the table
+		ids = []
+		for position in positions:
+			if keys is not None and keys[position] != '':
+				ids.append({'key': keys[position]})
+			else:
+				ids.append({'row': int(position)})
+		return ids
+
+	def changelog(self):
+		"""Return the changelog of the added, removed and modified plants as a dictionary."""
+		new_keys = self.new_keys
+		previous_keys = self.previous_keys
+
+		modified = []
+		for plant, columns in zip(self.__plant_ids(np.flatnonzero(self.modified_mask), new_keys),
+			self.modified_columns):
+			plant['changed_columns'] = columns
+			modified.append(plant)
+
+		return {
+			'country': self.country,
+			'previous_release': self.previous_release,
+			'created': datetime.datetime.now().isoformat(),
+			'keys': self.keys,
+			'summary': self.summary(),
+			'added': self.__plant_ids(np.flatnonzero(self.added_mask), new_keys),
+			'removed': self.__plant_ids(self.removed_positions, previous_keys),
+			'modified': modified,
+		}
+
+	def write_changelog(self, path):
+		"""Write the changelog to the given path as JSON."""
+		with open(path, 'w', encoding='utf-8') as f:
+			json.dump(self.changelog(), f, indent=2, ensure_ascii=False)
+
+
+def process_changes(df, country, previous_release, function, *args, changelog_directory_path='intermediate',
+	published_names=None, **kwargs):
+	"""
+	Call function(df, *args, **kwargs), e.g. the NUTS assignment, only for the plants which are new
+	or changed since the release at previous_release, and write the changelog to
+	changelog_directory_path/changelog_<country>.json.
+	The columns which the function reads and which are published under other names
+	must be mapped to those in published_names (see ReleaseDelta), or their changes are not detected.
+	If previous_release is None, the function is called for all the plants.
+	"""
+	if previous_release is None:
+		return function(df, *args, **kwargs)
+
+	delta = ReleaseDelta.from_previous_release(df, previous_release, country, published_names=published_names)
+	print('Changes in {} since {}: {}'.format(country, previous_release, delta.summary()))
+	# The input columns of the function (its arguments *_column) should be compared
+	names = published_names or {}
+	not_compared = [value for key, value in sorted(kwargs.items())
+					if key.endswith('_column') and names.get(value, value) not in delta.compared_columns]
+	if len(not_compared) > 0:
+		print('Warning: the changes of {} are not detected, as the previous release has no such columns.'.format(
+			', '.join(not_compared)))
+	if changelog_directory_path is not None:
+		delta.write_changelog(os.path.join(changelog_directory_path, 'changelog_{}.json'.format(country)))
+	return delta.apply(df, function, *args, **kwargs)
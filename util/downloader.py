@@ -4,25 +4,20 @@ import posixpath
 import urllib.parse
 import urllib.request
 import re
-import zipfile
 import pickle
 import urllib
 import shutil
 
 import numpy as np
 import pandas as pd
-import utm  # for transforming geoinformation in the utm format
 import requests
 import fake_useragent
 from string import Template
-from IPython.display import display
-import xlrd
-import bs4
-import bng_to_latlon
-import matplotlib.pyplot as plt
-from matplotlib.pyplot import figure
 
+from . import archives
 from .helper import get_beis_link
+from .instrumentation import stage, add_bytes_written
+from .mirror import Mirror
 from .scrapers.scraper_factory import ScraperFactory
 
 def download_and_cache(url, session=None, download_directory_path=None, filename=None):
@@ -70,13 +65,18 @@ def download_and_cache(url, session=None, download_directory_path=None, filename
 
 class Downloader(object):
 	"""docstring for Downloader"""
-	def __init__(self, version, input_directory_path, source_path, download_from):
+	def __init__(self, version, input_directory_path, source_path, download_from, mirror_path=None):
 		super(Downloader, self).__init__()
 		self.version = version
 		self.input_directory_path = input_directory_path
 		self.user_agent = None
 		self.source_df = pd.read_csv(source_path)
 		self.download_from = download_from
+		# The content-addressed mirror of the original files (see util.mirror), which download_from='mirror' reads
+		# from and which the other modes fill with the files they download, if it is a local directory
+		self.mirror = Mirror(mirror_path) if mirror_path is not None else None
+		if download_from == 'mirror' and self.mirror is None:
+			raise ValueError('mirror_path must be given if download_from is "mirror".')
 
 	def set_input_directory_path(self, input_directory_path):
 		self.input_directory_path = input_directory_path
@@ -111,7 +111,9 @@ class Downloader(object):
 			if session is not None:
 				scraper.set_session(session)
 			print('Scraping from', url)
-			scraper.scrape(filepath)
+			with stage('scrape', country=country, source=source_name):
+				scraper.scrape(filepath)
+				add_bytes_written(os.path.getsize(filepath))
 		else:
 			print('Using local file from', filepath)
 
@@ -145,13 +147,15 @@ class Downloader(object):
 				session = requests.session()
 
 			print("Downloading file ", filename, " from ", url)
-			headers = {'User-Agent' : self.user_agent.random}
-			response = session.get(url, headers=headers, stream=True)
-
-			chuncksize = 1024
-			with open(filepath, 'wb') as file_handler:
-				for chunck in response.iter_content(chuncksize):
-					file_handler.write(chunck)
+			with stage('download', country=country, source=source_name):
+				headers = {'User-Agent' : self.user_agent.random}
+				response = session.get(url, headers=headers, stream=True)
+
+				chuncksize = 1024
+				with open(filepath, 'wb') as file_handler:
+					for chunck in response.iter_content(chuncksize):
+						file_handler.write(chunck)
+				add_bytes_written(os.path.getsize(filepath))
 			print('Downloading: done.')
 		else:
 			print("Using local file from", filepath)
@@ -160,6 +164,22 @@ class Downloader(object):
 	
 		return filepath
 
+	def fetch_from_mirror(self, country, source_name, filename):
+		"""
+		Take the file from the mirror, unless it is already in the folder of the source.
+		Returns the local filepath.
+		"""
+		filepath = self.derive_filepath(country, source_name, filename)
+		if not os.path.exists(filepath):
+			print('Taking', filename, 'from the mirror at', self.mirror.path)
+			with stage('mirror', country=country, source=source_name):
+				self.mirror.fetch(self.version, country, source_name, filename, filepath)
+				add_bytes_written(os.path.getsize(filepath))
+		else:
+			print('Using local file from', filepath)
+
+		return filepath
+
 	def get_opsd_download_url(self, filename, country, source):
 		opsd_url = 'https://data.open-power-system-data.org/renewable_power_plants'
 		folder = 'original_data'
@@ -167,18 +187,31 @@ class Downloader(object):
 	
 		return opsd_download_url
 
-	def unzip_and_mark(self, filepath):
-		filename = filepath.split(os.sep)[-1]
-		new_directory_path = os.path.join(self.input_directory_path, country, source_name, "unzipped")
+	def unzip_and_mark(self, filepath, country=None, source_name=None):
+		"""
+		Extract the archive at filepath (which can be a virtual path into another archive, see util.archives)
+		into the folder 'unzipped' next to the source's files, or copy the file there if it is not an archive.
+		Returns the path of the folder.
+		"""
+		filename = filepath.split(archives.SEPARATOR)[-1].split(os.sep)[-1]
+		new_directory_path = os.path.join(os.path.dirname(self.derive_filepath(country, source_name, filename)),
+			'unzipped')
 		os.makedirs(new_directory_path, exist_ok=True)
-		if os.path.splitext(filepath)[1] != '.xlsx' and zipfile.is_zipfile(filepath):
-			zip_ref = zipfile.ZipFile(filepath, 'r')
-			zip_ref.extractall(new_directory_path)
-			zip_ref.close()
+		if os.path.splitext(filename)[1] != '.xlsx' and archives.is_archive(filepath):
+			archives.extract(filepath, new_directory_path)
 		else:
-			new_filepath = os.path.join(new_directory_path, filename)
-			shutil.copy(filepath, new_filepath)
-		
+			with archives.open_file(filepath) as source_file, \
+					open(os.path.join(new_directory_path, filename), 'wb') as target_file:
+				shutil.copyfileobj(source_file, target_file)
+		return new_directory_path
+
+	def get_member_paths(self, filepath):
+		"""
+		Return the virtual paths (see util.archives) of the files in the archive at filepath, indexed by their names,
+		so that they can be read without extracting the archive.
+		"""
+		return {member: archives.join_path(filepath, member) for member in archives.list_members(filepath)}
+
 	def get_filenames_for_opsd(self, source_df):
 		filenames_by_source = source_df[['source', 'filename']]
 		filenames_by_source = filenames_by_source.set_index('source')
@@ -204,6 +237,11 @@ class Downloader(object):
 			urls = urls.set_index('source')
 			data_urls.update(urls.to_dict(orient='index'))
 
+		elif self.download_from == 'mirror':
+			data_urls = {}
+			for source, filename in self.get_filenames_for_opsd(source_df).items():
+				data_urls[source] = {'url' : self.mirror.path, 'filename' : filename, 'download_method' : 'mirror'}
+
 		elif self.download_from == 'opsd_server':
 			data_urls = {}
 			filenames_by_source = self.get_filenames_for_opsd(source_df)
@@ -212,7 +250,7 @@ class Downloader(object):
 				data_urls.update({source : {'url' : self.get_opsd_download_url(filename, country, source), 'filename' : filename}})
 		
 		else:
-			raise ValueError('download_from must be "original_sources" or "opsd_server".')
+			raise ValueError('download_from must be "original_sources", "opsd_server" or "mirror".')
 		
 		return data_urls
 
@@ -224,10 +262,16 @@ class Downloader(object):
 			url = urls[source_name]['url']
 			filename = urls[source_name]['filename']
 			
-			if 'download_method' in urls[source_name] and urls[source_name]['download_method'] == 'scrape':
-				datapath = self.scrape_and_cache(url, country, source_name, filename)
+			download_method = urls[source_name].get('download_method')
+			if download_method == 'mirror':
+				datapath = self.fetch_from_mirror(country, source_name, filename)
 			else:
-				datapath = self.download_and_cache(url, country=country, source_name=source_name, filename=filename)
+				if download_method == 'scrape':
+					datapath = self.scrape_and_cache(url, country, source_name, filename)
+				else:
+					datapath = self.download_and_cache(url, country=country, source_name=source_name, filename=filename)
+				if self.mirror is not None and not self.mirror.is_remote:
+					self.mirror.add(datapath, self.version, country, source_name, filename, url=url)
 			
 			local_paths[source_name] = datapath
 
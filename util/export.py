@@ -0,0 +1,285 @@
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+from .helper import apply_to_distinct_values
+from .instrumentation import stage, instrumented, add_bytes_written
+
+
+# Define the column-level kernels of the cleaning types used before the export.
+# They keep native dtypes; the values are formatted by the writers.
+def to_decimal(series):
+	return pd.to_numeric(series, errors='coerce').round(14)
+
+def to_integer(series):
+	# Use the nullable integer type, so that the missing values do not turn the column into floats
+	return pd.to_numeric(series, errors='coerce').round().astype('Int64')
+
+def to_date(series):
+	return pd.to_datetime(series, errors='coerce').dt.normalize()
+
+def to_one_line(series):
+	# Remove the line breaks from the strings, leaving the other values as they are.
+	# Each distinct value is processed only once.
+	def remove_line_breaks(uniques):
+		is_string = np.array([type(x) is str for x in uniques], dtype=bool)
+		uniques[is_string] = uniques[is_string].str.replace('\r', '', regex=False).str.replace('\n', '', regex=False)
+		return uniques
+	return apply_to_distinct_values(series, remove_line_breaks)
+
+CLEANING_FUNCTIONS = {
+	'decimal': to_decimal,
+	'integer': to_integer,
+	'date': to_date,
+	'one-line string': to_one_line,
+}
+
+def clean_column(df, field, cleaning_type):
+	"""Clean the column field of df in place according to the cleaning type (a key of CLEANING_FUNCTIONS)."""
+	if cleaning_type not in CLEANING_FUNCTIONS:
+		raise ValueError('Unknown cleaning type: ' + str(cleaning_type))
+	df[field] = CLEANING_FUNCTIONS[cleaning_type](df[field])
+	return df
+
+
+# The options with which all the csv files of the data package are written
+CSV_OPTIONS = {
+	'sep': ',',
+	'decimal': '.',
+	'date_format': '%Y-%m-%d',
+	'line_terminator': '\n',
+	'index': False,
+}
+
+# The number of rows formatted at once by a worker when the csv files are written in parallel
+CSV_CHUNK_ROWS = 50000
+
+# The compressed variants which write_csv can write along with the csv file, by the extension of their files
+CSV_COMPRESSIONS = ['gz', 'zst']
+
+# The dataframe formatted by the worker processes, set before they are started
+_worker_df = None
+
+
+def _format_csv(df, float_format, header=False):
+	return df.to_csv(None, header=header, float_format=float_format, **CSV_OPTIONS).encode('utf-8')
+
+
+def _set_worker_df(df):
+	global _worker_df
+	_worker_df = df
+
+
+def _format_rows(task):
+	start, end, float_format = task
+	return _format_csv(_worker_df.iloc[start:end], float_format)
+
+
+def _format_chunk(task):
+	chunk, float_format = task
+	return _format_csv(chunk, float_format)
+
+
+def _formatted_chunks(df, float_format, processes):
+	"""
+	Yield the rows of df formatted as csv, in chunks of CSV_CHUNK_ROWS rows and in order. The chunks are
+	formatted in worker processes: where processes can be forked, they inherit df and receive only the row ranges,
+	otherwise each chunk is sent to them. Each value is formatted on its own, so the chunks joined are the same
+	as the rows formatted at once.
+	"""
+	import multiprocessing
+
+	bounds = [(start, min(start + CSV_CHUNK_ROWS, df.shape[0])) for start in range(0, df.shape[0], CSV_CHUNK_ROWS)]
+	if processes <= 1 or len(bounds) < 2:
+		for start, end in bounds:
+			yield _format_csv(df.iloc[start:end], float_format)
+	elif 'fork' in multiprocessing.get_all_start_methods():
+		_set_worker_df(df)
+		try:
+			with multiprocessing.get_context('fork').Pool(processes) as pool:
+				for chunk in pool.imap(_format_rows, [(start, end, float_format) for start, end in bounds]):
+					yield chunk
+		finally:
+			_set_worker_df(None)
+	else:
+		with multiprocessing.Pool(processes) as pool:
+			tasks = ((df.iloc[start:end], float_format) for start, end in bounds)
+			for chunk in pool.imap(_format_chunk, tasks):
+				yield chunk
+
+
+def _compressed_file_opener(compression):
+	# Return the function opening a file compressed with compression.
+	# An unknown or unavailable compression fails here, before any file is opened.
+	if compression == 'gz':
+		import gzip
+		# Without the time of writing in the header, the same data give the same file
+		return lambda path: gzip.GzipFile(path, 'wb', compresslevel=6, mtime=0)
+	if compression == 'zst':
+		try:
+			import zstandard
+		except ImportError:
+			raise ImportError('Writing the zst files requires the package zstandard.')
+		return lambda path: zstandard.ZstdCompressor().stream_writer(open(path, 'wb'))
+	raise ValueError('Unknown compression: {}. Choose one of: {}'.format(compression, ', '.join(CSV_COMPRESSIONS)))
+
+
+def write_csv(df, path, float_format=None, processes=1, compressions=()):
+	"""
+	Write df as a csv file formatted as the files in the data package.
+	With several processes, the rows are formatted in parallel (see _formatted_chunks) into the same file.
+	For each compression in compressions (see CSV_COMPRESSIONS), the compressed file path.<compression>
+	is written along with it.
+	"""
+	with stage('export_csv', rows=df.shape[0], file=os.path.basename(path)):
+		if processes <= 1 and len(compressions) == 0:
+			df.to_csv(path, float_format=float_format, encoding='utf-8', **CSV_OPTIONS)
+			add_bytes_written(os.path.getsize(path))
+			return
+
+		openers = [_compressed_file_opener(compression) for compression in compressions]
+		paths = [path] + ['{}.{}'.format(path, compression) for compression in compressions]
+		files = []
+		try:
+			files.append(open(path, 'wb'))
+			for compressed_path, opener in zip(paths[1:], openers):
+				files.append(opener(compressed_path))
+			for chunk in itertools.chain([_format_csv(df.iloc[:0], float_format, header=True)],
+										 _formatted_chunks(df, float_format, processes)):
+				for f in files:
+					f.write(chunk)
+		finally:
+			for f in files:
+				f.close()
+		for written_path in paths:
+			add_bytes_written(os.path.getsize(written_path))
+
+
+def write_sql(df, table_name, engine, chunksize=100000):
+	"""
+	Write df to the given table of the SQL database, replacing it if it exists.
+	The dates are written as yyyy-mm-dd, as in the csv files. They are formatted
+	chunk by chunk, so the date columns are never copied as strings all at once.
+	"""
+	with stage('export_sqlite', rows=df.shape[0], table=table_name):
+		date_columns = [column for column in df.columns if pd.api.types.is_datetime64_any_dtype(df[column])]
+		for start in range(0, max(df.shape[0], 1), chunksize):
+			chunk = df.iloc[start:start + chunksize]
+			if len(date_columns) > 0:
+				chunk = chunk.copy()
+				for column in date_columns:
+					chunk[column] = chunk[column].dt.strftime('%Y-%m-%d')
+			if_exists = 'replace' if start == 0 else 'append'
+			chunk.to_sql(table_name, engine, if_exists=if_exists, index=False)
+
+
+# Define the function which writes a row of data to a row in an Excel sheet
+def write_row(row, sheet, data_index, offset=0):
+	sheet_row_index = data_index + 1 - offset
+	for j, field in enumerate(row):
+		if pd.isna(field):
+			field = ''
+		elif isinstance(field, (int, np.integer)) and abs(field) >= 2**53:
+			# Excel stores numbers as doubles, so write large integers such as ids as text to keep all the digits
+			field = str(field)
+		sheet.write(sheet_row_index, j, field)
+	#sheet.write_row(sheet_row_index, 0, row)
+
+# Define the function for converting column number in Excel names
+# Note: the column numbering is assumed to start from zero.
+def excel_column_name(number):
+	if number < 26:
+		return chr(ord('A') + number)
+	else:
+		return excel_column_name((number // 26) - 1) + excel_column_name(number % 26)
+
+# Define the function for creating a named sheet in the given xlsxwriter Workbook, writing its header
+# and formatting its columns according to a given dictionary of pairs {data_column: excel_format}.
+def create_sheet(book, sheet_name, header, formats={}):
+	# Create the sheet
+	sheet = book.add_worksheet(name=sheet_name)
+
+	# Write the header
+	sheet.write_row(0, 0, header)
+
+	# Set the format of date columns
+	for j in range(len(header)):
+		column_format = formats.get(header[j], None)
+		if column_format is not None:
+			excel_name = excel_column_name(j)
+			sheet.set_column('{}:{}'.format(excel_name, excel_name), None, column_format)
+
+	return sheet
+
+# Define the function for writing a dataframe to an Excel file efficiently.
+# The goal is not just to split a df across several sheets if it's too large,
+# but also to reduce the RAM usage and make the process run faster.
+# Make sure that book is an xlsxwriter.Workbook with constant memory set to True.
+# That way, the data written to its sheets will be flushed after each row, so RAM usage
+# will be kept at a constant level. Without constant_memory set to True, the same data would be copied
+# to the sheets, which are kept in RAM, so the total amount of RAM used to store the data would at least double
+# which could make everything slower if you don't have enough RAM.
+# Note: pandas does provide method to_excel which receives an Excel writer, but
+# even if you set its parameter constant_memory to True, it won't work because to_excel writes the data
+# column by column, whereas constant_memory requires the data to be written row after row.
+@instrumented('export_xlsx', rows_argument='df')
+def write_df_to_excel(df, book, max_sheet_size, formats={}, name=None):
+	# Get the number of rows in the df
+	number_of_rows = df.shape[0]
+
+	# Get the df's header
+	header = df.columns
+
+	# Check if the df is too large to fit in to one sheet.
+	if number_of_rows > max_sheet_size:
+		# If so, define the indices which will separate the sheets.
+		boundaries = list(range(0, number_of_rows, max_sheet_size)) + [number_of_rows]
+
+		# Include the final index if it is not already there
+		if boundaries[-1] != number_of_rows:
+			boundaries += [number_of_rows]
+
+		number_of_sheets = len(boundaries) - 1
+
+		# Split the data across the sheets
+		# so that the i-th sheet contains the data whose indices are in the range [splitters[i], splitters[i+1])
+		print('\tSplitting the data into {} sheets'.format(number_of_sheets))
+
+		for i in range(number_of_sheets):
+			# Define the sheet's name.
+			if name is not None:
+				sheet_name_format = name + ' part-{}'
+			else:
+				sheet_name_format = 'part-{}'
+			# i + 1 because i is a zero-based index and 1-based indices are more readable
+			sheet_name = sheet_name_format.format(i + 1)
+
+			# Create the sheet
+			sheet = create_sheet(book, sheet_name, header, formats)
+
+			# Get the sheet's boundary indices.
+			start = boundaries[i]
+			end = boundaries[i + 1]
+
+			# Calculate the offset. It is 0 for the first sheet.
+			# For all the other sheets, it is equal to the total number of rows written before the sheet at hand.
+			if i == 0:
+				offset = 0
+			else:
+				offset = i * max_sheet_size
+
+			# Write the data.
+			print('\t\tWriting [{}:{}] into the sheet number {}'.format(start, end, i + 1))
+			for data_int_index in range(start, end):
+				row = df.iloc[data_int_index, :]
+				write_row(row, sheet, data_int_index, offset)
+	else:
+		# Create the sheet for the df
+		sheet = create_sheet(book, name, header, formats)
+
+		# Write the data
+		for data_int_index in range(number_of_rows):
+			row = df.iloc[data_int_index, :]
+			write_row(row, sheet, data_int_index)
@@ -0,0 +1,160 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from .archives import open_file, join_path, split_path
+from .helper import apply_to_distinct_values
+
+# The columns of the GeoNames postal code dumps, as defined in their readme file
+GEONAMES_COLUMNS = ['country_code', 'postcode', 'place_name', 'admin_name1',
+                    'admin_code1', 'admin_name2', 'admin_code2', 'admin_name3',
+                    'admin_code3', 'lat', 'lon', 'accuracy']
+
+
+def read_geonames(geonames_filepath, member):
+	"""Read the GeoNames postcode table stored as `member` in the given zip file."""
+	with open_file(join_path(geonames_filepath, member)) as geonames_file:
+		geonames_df = pd.read_csv(geonames_file,
+			sep='\t',
+			header=None,
+			names=GEONAMES_COLUMNS,
+			dtype={'postcode': str}
+		)
+
+	return geonames_df
+
+
+def postcodes_to_strings(postcodes):
+	"""
+	Convert a series of postcodes to stripped strings, leaving the missing ones as NaN.
+	Numeric postcodes such as 8000.0 are converted to '8000'.
+	"""
+	postcodes = pd.Series(postcodes)
+	if pd.api.types.is_numeric_dtype(postcodes.dtype):
+		missing = postcodes.isnull()
+		strings = pd.Series(np.nan, index=postcodes.index, dtype=object)
+		strings[~missing] = postcodes[~missing].round().astype(np.int64).astype(str)
+		return strings
+
+	def stripped(uniques):
+		strings = uniques.astype(str).str.strip()
+		return strings.where(strings != '')
+	return apply_to_distinct_values(postcodes, stripped)
+
+
+class PostcodeGeocoder(object):
+	"""
+	Geocoding index for the postcodes of one country, built from a GeoNames postcode dump.
+
+	A postcode is resolved by the first matching level of the chain:
+	1. 'postcode': the exact postcode,
+	2. 'outward_code': the centroid of the postcodes sharing its outward code,
+	   i.e. the part before the space (e.g. 'AB10' for 'AB10 1AA'),
+	3. 'prefix_<n>': the centroid of the postcodes sharing its first n characters,
+	   for each n in prefix_lengths, from the longest to the shortest,
+	4. 'country': the centroid of all the country's postcodes.
+	Levels 2-4 are used only if enabled.
+	"""
+	def __init__(self, geonames_df, outward_codes=False, prefix_lengths=None, country_centroid=False):
+		super(PostcodeGeocoder, self).__init__()
+		geonames_df = geonames_df.copy()
+		geonames_df['postcode'] = postcodes_to_strings(geonames_df['postcode'])
+		geonames_df = geonames_df[geonames_df['postcode'].notnull()]
+		geonames_df = geonames_df.drop_duplicates('postcode', keep='last')
+		geonames_df = geonames_df.reset_index(drop=True)
+		self.geonames_df = geonames_df
+
+		self.levels = [('postcode', None)]
+		if outward_codes:
+			self.levels.append(('outward_code', None))
+		for prefix_length in sorted(prefix_lengths or [], reverse=True):
+			self.levels.append(('prefix_{}'.format(prefix_length), prefix_length))
+
+		coordinates = geonames_df[['lat', 'lon']]
+		self.tables = {}
+		for level, prefix_length in self.levels:
+			keys = self.__keys(geonames_df['postcode'], level, prefix_length)
+			self.tables[level] = coordinates.groupby(keys.values).mean()
+
+		self.country_centroid = None
+		if country_centroid:
+			self.country_centroid = (coordinates['lat'].mean(), coordinates['lon'].mean())
+
+	@classmethod
+	def from_geonames(cls, geonames_filepath, member, cache=True, **kwargs):
+		"""
+		Build the geocoder for the GeoNames dump stored as `member` in the given zip file.
+		If cache is True, the geocoder is pickled next to the zip file and reused
+		as long as the zip file and the settings do not change.
+		"""
+		stem = os.path.splitext(os.path.basename(member))[0]
+		# The zip file can also be a virtual path into another archive, so use the file on disk for the cache
+		archive_filepath = split_path(geonames_filepath)[0]
+		cache_path = os.path.splitext(archive_filepath)[0] + '_' + stem + '_geocoder.pickle'
+		settings = sorted(kwargs.items())
+
+		if cache and os.path.exists(cache_path) and \
+				os.path.getmtime(cache_path) >= os.path.getmtime(archive_filepath):
+			with open(cache_path, 'rb') as f:
+				cached_settings, geocoder = pickle.load(f)
+			if cached_settings == settings:
+				return geocoder
+
+		geocoder = cls(read_geonames(geonames_filepath, member), **kwargs)
+
+		if cache:
+			with open(cache_path, 'wb') as f:
+				pickle.dump((settings, geocoder), f)
+
+		return geocoder
+
+	def __keys(self, postcodes, level, prefix_length):
+		if level == 'postcode':
+			return postcodes
+		elif level == 'outward_code':
+			return postcodes.str.split(' ').str[0]
+		else:
+			keys = postcodes.str.replace(' ', '', regex=False)
+			return keys.str[:prefix_length].where(keys.str.len() >= prefix_length)
+
+	def geocode(self, postcodes):
+		"""
+		Determine the coordinates of the given postcodes.
+		Returns a dataframe with the same index as postcodes and the columns
+		lat, lon and geocoding_precision (the level at which each postcode was resolved,
+		or NaN if it could not be resolved).
+		"""
+		postcodes = postcodes_to_strings(postcodes)
+
+		# Resolve each distinct postcode only once
+		codes, uniques = pd.factorize(postcodes)
+		uniques = pd.Series(uniques, dtype=object)
+		resolved = pd.DataFrame({'lat': np.nan, 'lon': np.nan, 'geocoding_precision': np.nan},
+			index=uniques.index
+		)
+		resolved['geocoding_precision'] = resolved['geocoding_precision'].astype(object)
+		unresolved = pd.Series(True, index=uniques.index)
+
+		for level, prefix_length in self.levels:
+			if not unresolved.any():
+				break
+			keys = self.__keys(uniques[unresolved], level, prefix_length)
+			found = self.tables[level].reindex(keys.values)
+			found.index = keys.index
+			found = found[found['lat'].notnull() & found['lon'].notnull()]
+			resolved.loc[found.index, ['lat', 'lon']] = found[['lat', 'lon']].values
+			resolved.loc[found.index, 'geocoding_precision'] = level
+			unresolved[found.index] = False
+
+		if self.country_centroid is not None and unresolved.any():
+			resolved.loc[unresolved, ['lat', 'lon']] = self.country_centroid
+			resolved.loc[unresolved, 'geocoding_precision'] = 'country'
+
+		# Broadcast the results back to all the rows; missing postcodes stay unresolved
+		resolved = resolved.reindex(range(len(uniques) + 1))
+		result = resolved.iloc[np.where(codes >= 0, codes, len(uniques))]
+		result.index = postcodes.index
+
+		return result
@@ -1,10 +1,10 @@
-import requests
-import bs4
-from IPython.display import display, Markdown
 import pandas as pd
 import numpy as np
 
 def get_beis_link(UK_page_url):
+	import requests
+	import bs4
+
 	UK_link_selector = '.download strong'
 	response = requests.get(UK_page_url)
 	html = response.content
@@ -17,6 +17,8 @@ def get_beis_link(UK_page_url):
 
 
 def get_markdowns_for_sources(countries_df, sources_df, metadata):
+	from IPython.display import Markdown
+
 	sources_df.fillna("",inplace=True)
 	country_format = "## {full_name} - {short_name}\n{data_description}"
 	source_format_with_long_description = """
@@ -79,9 +81,126 @@ def standardize_string(x, lower=False):
 		return x
 	
 def standardize_column(df, column, lower=False):
-	df.loc[:, column]= df.apply(lambda row: standardize_string(row[column], lower=lower),
-								axis=1
-							   )
+	standardize_columns(df, [column], lower=lower)
+
+
+def apply_to_distinct_values(values, function, missing=np.nan):
+	"""
+	Apply function to the distinct values of values (a series or an array) and broadcast the results to all of them.
+	function takes the distinct values as a series and returns a series or an array of the same length.
+	The missing values are not passed to function and are set to missing in the result.
+	"""
+	values = pd.Series(values)
+	codes, uniques = pd.factorize(values)
+	results = function(pd.Series(uniques, dtype=object))
+	# The code -1 marks the missing values, so it takes the appended value
+	results = np.append(np.asarray(results, dtype=object), missing)
+	return pd.Series(results[codes], index=values.index, name=values.name)
+
+
+def _standardize_unique_strings(uniques, lower=False, strip=True, one_line=False, collapse_whitespace=False):
+	# Non-string values are treated as missing, as in standardize_string
+	is_string = np.array([type(x) is str for x in uniques], dtype=bool)
+	strings = uniques.where(is_string)
+	if one_line:
+		strings = strings.str.replace('\r', '', regex=False).str.replace('\n', '', regex=False)
+	if collapse_whitespace:
+		strings = strings.str.replace(r'\s+', ' ', regex=True)
+	if strip:
+		strings = strings.str.strip()
+	if lower:
+		strings = strings.str.lower()
+	return strings
+
+
+def standardize_strings(values, lower=False, strip=True, one_line=False, collapse_whitespace=False):
+	"""
+	Vectorized version of standardize_string for a whole series.
+	Every distinct value is cleaned only once, so the cost depends on the number of distinct values.
+	If one_line is True, carriage returns and newlines are removed.
+	If collapse_whitespace is True, runs of whitespace are replaced by a single space.
+	"""
+	return apply_to_distinct_values(values, lambda uniques: _standardize_unique_strings(uniques, lower=lower,
+		strip=strip, one_line=one_line, collapse_whitespace=collapse_whitespace))
+
+
+def standardize_columns(df, columns, lower=False, strip=True, one_line=False, collapse_whitespace=False):
+	"""
+	Standardize the string columns of df in place.
+	The values of all the columns are factorized together, so a value appearing
+	in several columns or rows is cleaned only once.
+	"""
+	missing_columns = [column for column in columns if column not in df.columns]
+	if len(missing_columns) > 0:
+		raise KeyError('The columns {} are not in the dataframe.'.format(missing_columns))
+	if len(columns) == 0:
+		return df
+
+	values = np.concatenate([df[column].values.astype(object) for column in columns])
+	cleaned = standardize_strings(values, lower=lower, strip=strip, one_line=one_line,
+		collapse_whitespace=collapse_whitespace).values
+
+	number_of_rows = df.shape[0]
+	for i, column in enumerate(columns):
+		df[column] = pd.Series(cleaned[i * number_of_rows:(i + 1) * number_of_rows], index=df.index)
+
+	return df
+
+
+def join_string_columns(df, columns, sep=' '):
+	"""
+	Join the given columns into one string per row, e.g. address and address number.
+	Missing values are treated as empty strings and the result is stripped.
+	Each distinct value is converted to a string only once.
+	"""
+	joined = None
+	for column in columns:
+		strings = apply_to_distinct_values(df[column], lambda uniques: uniques.astype(str), missing='')
+		joined = strings if joined is None else joined + sep + strings
+	return joined.str.strip()
+
+
+def concat_keeping_categories(frames, **kwargs):
+	"""
+	Concatenate the frames with pd.concat (which gets kwargs), keeping the columns categorical in any frame
+	as categories. pd.concat turns such a column into objects unless all the frames have it with the same
+	categories, so in each frame it is first set to the union of the categories and the other frames' values.
+	"""
+	frames = list(frames)
+	values = {}
+	for frame in frames:
+		for column in frame.columns:
+			if isinstance(frame[column].dtype, pd.api.types.CategoricalDtype):
+				values.setdefault(column, [])
+	if len(values) == 0:
+		return pd.concat(frames, **kwargs)
+
+	for frame in frames:
+		for column in values:
+			if column not in frame.columns:
+				continue
+			if isinstance(frame[column].dtype, pd.api.types.CategoricalDtype):
+				values[column].extend(frame[column].cat.categories)
+			else:
+				values[column].extend(frame[column].dropna().unique())
+	dtypes = {column: pd.api.types.CategoricalDtype(pd.Series(column_values, dtype=object).unique())
+		for column, column_values in values.items()}
+
+	# The columns are set on shallow copies, so the frames passed are not changed
+	cast_frames = []
+	for frame in frames:
+		frame = frame.copy(deep=False)
+		for column, dtype in dtypes.items():
+			if column in frame.columns:
+				frame[column] = frame[column].astype(dtype)
+		cast_frames.append(frame)
+	concatenated = pd.concat(cast_frames, **kwargs)
+
+	# A frame without the column still makes pd.concat fill it with objects
+	for column, dtype in dtypes.items():
+		if concatenated[column].dtype != dtype:
+			concatenated[column] = concatenated[column].astype(dtype)
+	return concatenated
 
 
 # -*- coding: utf-8 -*-
@@ -0,0 +1,187 @@
+"""
+Lightweight instrumentation of the processing stages (downloads, scraping, NUTS assignment,
+translation, export). For each stage, the wall time, CPU time, peak RSS, number of rows
+and the bytes read and written are recorded, so that a run report can be produced at the end.
+
+Instrumentation is disabled by default, in which case stage() and instrumented() do almost nothing.
+
+Usage:
+	import util.instrumentation
+	util.instrumentation.enable()
+
+	with util.instrumentation.stage('translation', country='DE', rows=df.shape[0]):
+		df.replace(value_dict, inplace=True)
+
+	util.instrumentation.print_report()
+	util.instrumentation.write_report('run_report.json')
+"""
+import contextlib
+import datetime
+import functools
+import inspect
+import json
+import sys
+import time
+
+try:
+	import resource
+except ImportError:
+	# The resource module is not available on Windows, so the peak RSS is not recorded there
+	resource = None
+
+REPORT_COLUMNS = ['stage', 'country', 'rows', 'wall_time', 'cpu_time', 'peak_rss', 'peak_rss_increase',
+				  'bytes_read', 'bytes_written']
+
+_enabled = False
+_records = []
+_active = []
+
+
+def enable():
+	global _enabled
+	_enabled = True
+
+
+def disable():
+	global _enabled
+	_enabled = False
+
+
+def is_enabled():
+	return _enabled
+
+
+def reset():
+	"""Forget all the recorded stages."""
+	del _records[:]
+
+
+def peak_rss():
+	"""Return the peak resident set size of the process in bytes, or None if it is unknown."""
+	if resource is None:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# ru_maxrss is given in bytes on macOS, but in kilobytes on Linux
+	if sys.platform == 'darwin':
+		return peak
+	return peak * 1024
+
+
+@contextlib.contextmanager
+def stage(name, country=None, rows=None, **details):
+	"""
+	Record the resources used by the enclosed block as the stage `name`.
+	Additional details (e.g. the source or the file name) are stored with the record.
+	Yields the record (a dictionary), or None if instrumentation is disabled.
+	"""
+	if not _enabled:
+		yield None
+		return
+
+	record = {'stage': name, 'country': country, 'rows': rows, 'bytes_read': 0, 'bytes_written': 0}
+	record.update(details)
+	peak_rss_before = peak_rss()
+	wall_start = time.perf_counter()
+	cpu_start = time.process_time()
+	_active.append(record)
+	try:
+		yield record
+	finally:
+		_active.pop()
+		record['wall_time'] = time.perf_counter() - wall_start
+		record['cpu_time'] = time.process_time() - cpu_start
+		record['peak_rss'] = peak_rss()
+		if peak_rss_before is not None:
+			record['peak_rss_increase'] = record['peak_rss'] - peak_rss_before
+		_records.append(record)
+
+
+def instrumented(name, country_argument=None, rows_argument=None):
+	"""
+	Decorator recording each call of the function as the stage `name`.
+	country_argument is the name of the function's argument holding the country, and
+	rows_argument the name of the argument holding the dataframe whose rows are counted.
+	"""
+	def decorator(function):
+		signature = inspect.signature(function)
+
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			if not _enabled:
+				return function(*args, **kwargs)
+
+			arguments = signature.bind(*args, **kwargs).arguments
+			country = arguments.get(country_argument)
+			rows = arguments.get(rows_argument)
+			if rows is not None:
+				rows = len(rows)
+			with stage(name, country=country, rows=rows):
+				return function(*args, **kwargs)
+
+		return wrapper
+
+	return decorator
+
+
+def set_rows(rows):
+	"""Set the number of rows of the innermost active stage."""
+	if len(_active) > 0:
+		_active[-1]['rows'] = rows
+
+
+def add_bytes_read(number_of_bytes):
+	"""Add the bytes to the bytes read by all the active stages."""
+	for record in _active:
+		record['bytes_read'] += number_of_bytes
+
+
+def add_bytes_written(number_of_bytes):
+	"""Add the bytes to the bytes written by all the active stages."""
+	for record in _active:
+		record['bytes_written'] += number_of_bytes
+
+
+def get_records():
+	"""Return the records of the finished stages, in the order in which they finished."""
+	return [dict(record) for record in _records]
+
+
+def report_df():
+	"""Return the run report as a dataframe with one row per finished stage."""
+	import pandas as pd
+
+	records = get_records()
+	columns = REPORT_COLUMNS + sorted({key for record in records for key in record} - set(REPORT_COLUMNS))
+	return pd.DataFrame(records, columns=columns)
+
+
+def print_report():
+	df = report_df()
+	if df.empty:
+		print('No stages were recorded. Call util.instrumentation.enable() to record them.')
+		return
+
+	print('Stages:')
+	print(df.to_string(index=False))
+	print('\nTotals per stage:')
+	totals = df.groupby('stage')[['wall_time', 'cpu_time', 'bytes_read', 'bytes_written']].sum()
+	totals['peak_rss'] = df.groupby('stage')['peak_rss'].max()
+	print(totals.to_string())
+
+
+def write_report(path):
+	"""Write the run report to the given path as JSON."""
+	report = {
+		'created': datetime.datetime.now().isoformat(),
+		'peak_rss': peak_rss(),
+		'stages': get_records(),
+	}
+	with open(path, 'w') as f:
+		json.dump(report, f, indent=2, default=_to_json)
+
+
+def _to_json(value):
+	# Convert numpy numbers to Python numbers and anything else to a string
+	if hasattr(value, 'item'):
+		return value.item()
+	return str(value)
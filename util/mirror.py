@@ -0,0 +1,151 @@
+"""
+A content-addressed local mirror of the original data files.
+
+Each file is stored once, under the SHA-256 hash of its content, no matter how many versions or countries use it:
+	<mirror>/blobs/<first two digits of the hash>/<hash>
+and the manifest maps the source files of each data package version and country to their hashes:
+	<mirror>/manifest.json: {"<version>/<country>/<source>/<filename>": {"sha256": ..., "size": ..., "mtime_ns": ..., "url": ...}}
+The version is part of the key, as a source often publishes its updates under the same filename.
+The mirror can be a local directory, which the Downloader fills with the files it downloads,
+or a URL under which such a directory is served (read-only).
+With download_from='mirror', the Downloader takes the files from the mirror instead of the original sources,
+so that machines without internet access can run the pipeline and new workers are set up by a local copy.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+MANIFEST_FILENAME = 'manifest.json'
+BLOBS_DIRECTORY = 'blobs'
+
+
+def file_digest(filepath, chunk_size=1024 * 1024):
+	"""Return the SHA-256 hash of the file's content as a hex string."""
+	digest = hashlib.sha256()
+	with open(filepath, 'rb') as f:
+		for chunk in iter(lambda: f.read(chunk_size), b''):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+
+def _link_or_copy(source_path, target_path):
+	# Hard-link the file if the file system allows it, as that takes no space; copy it otherwise
+	try:
+		os.link(source_path, target_path)
+	except (OSError, AttributeError):
+		shutil.copyfile(source_path, target_path)
+
+
+class Mirror(object):
+	"""A content-addressed store of the original data files, in a local directory or under a URL."""
+	def __init__(self, path):
+		super(Mirror, self).__init__()
+		self.path = path
+		self.is_remote = path.startswith(('http://', 'https://'))
+		self.__manifest = None
+
+	def __location(self, *parts):
+		if self.is_remote:
+			return '/'.join([self.path.rstrip('/')] + list(parts))
+		return os.path.join(self.path, *parts)
+
+	@staticmethod
+	def key(version, country, source_name, filename):
+		return '/'.join([version, country, source_name, filename])
+
+	def blob_location(self, digest):
+		"""Return the path (or the URL, if the mirror is remote) of the blob with the given hash."""
+		return self.__location(BLOBS_DIRECTORY, digest[:2], digest)
+
+	@property
+	def manifest(self):
+		if self.__manifest is None:
+			location = self.__location(MANIFEST_FILENAME)
+			if self.is_remote:
+				import requests
+				response = requests.get(location)
+				response.raise_for_status()
+				self.__manifest = response.json()
+			elif os.path.exists(location):
+				with open(location, encoding='utf-8') as f:
+					self.__manifest = json.load(f)
+			else:
+				self.__manifest = {}
+		return self.__manifest
+
+	def save_manifest(self):
+		if self.is_remote:
+			raise ValueError('The mirror at {} is read-only.'.format(self.path))
+		os.makedirs(self.path, exist_ok=True)
+		# Write to a temporary file first, so that an interrupted run does not leave a broken manifest
+		handle, temporary_path = tempfile.mkstemp(dir=self.path, suffix='.json')
+		with os.fdopen(handle, 'w', encoding='utf-8') as f:
+			json.dump(self.manifest, f, indent=1, sort_keys=True)
+		os.replace(temporary_path, self.__location(MANIFEST_FILENAME))
+
+	def lookup(self, version, country, source_name, filename):
+		"""Return the manifest's entry for the file, or None if the mirror does not have it."""
+		return self.manifest.get(self.key(version, country, source_name, filename))
+
+	def add(self, filepath, version, country, source_name, filename, url=None):
+		"""
+		Store the file in the mirror (unless a file with the same content is there already)
+		and record it in the manifest. Returns the file's hash.
+		The file is not hashed again if its size and modification time are those recorded for it.
+		"""
+		if self.is_remote:
+			raise ValueError('The mirror at {} is read-only.'.format(self.path))
+
+		key = self.key(version, country, source_name, filename)
+		status = os.stat(filepath)
+		entry = self.manifest.get(key)
+		if entry is not None and entry.get('size') == status.st_size and entry.get('mtime_ns') == status.st_mtime_ns \
+				and entry.get('url') == url and os.path.exists(self.blob_location(entry['sha256'])):
+			return entry['sha256']
+
+		digest = file_digest(filepath)
+		blob_path = self.blob_location(digest)
+		if not os.path.exists(blob_path):
+			os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+			temporary_path = blob_path + '.part'
+			shutil.copyfile(filepath, temporary_path)
+			os.replace(temporary_path, blob_path)
+
+		entry = {'sha256': digest, 'size': status.st_size, 'mtime_ns': status.st_mtime_ns, 'url': url}
+		if self.manifest.get(key) != entry:
+			self.manifest[key] = entry
+			self.save_manifest()
+		return digest
+
+	def fetch(self, version, country, source_name, filename, target_path, session=None):
+		"""
+		Put the mirrored file at target_path: link or copy it from a local mirror,
+		or download it from a remote one. Raises KeyError if the mirror does not have the file.
+		"""
+		entry = self.lookup(version, country, source_name, filename)
+		if entry is None:
+			raise KeyError('The mirror at {} has no file {}.'.format(
+				self.path, self.key(version, country, source_name, filename)))
+
+		os.makedirs(os.path.dirname(target_path), exist_ok=True)
+		blob_location = self.blob_location(entry['sha256'])
+		if not self.is_remote:
+			_link_or_copy(blob_location, target_path)
+			return target_path
+
+		import requests
+		if session is None:
+			session = requests.session()
+		response = session.get(blob_location, stream=True)
+		response.raise_for_status()
+		temporary_path = target_path + '.part'
+		with open(temporary_path, 'wb') as f:
+			for chunk in response.iter_content(1024 * 1024):
+				f.write(chunk)
+		if file_digest(temporary_path) != entry['sha256']:
+			os.remove(temporary_path)
+			raise ValueError('The file {} downloaded from the mirror is corrupt.'.format(blob_location))
+		os.replace(temporary_path, target_path)
+		return target_path
@@ -0,0 +1,87 @@
+"""
+Run the code cells of the notebooks without Jupyter, so that the pipeline can be run from the command line.
+"""
+import ast
+import json
+import re
+
+
+def read_cells(notebook_path):
+	"""
+	Read the code cells of the notebook.
+	Returns a list of (headings, source) pairs, where headings maps each heading level
+	(1 for '#', 2 for '##', ...) to the title of the section containing the cell.
+	"""
+	with open(notebook_path, encoding='utf-8') as f:
+		notebook = json.load(f)
+
+	headings = {}
+	cells = []
+	for cell in notebook['cells']:
+		source = ''.join(cell['source'])
+		if cell['cell_type'] == 'markdown':
+			for line in source.split('\n'):
+				match = re.match(r'^(#+)\s+(.*?)\s*$', line)
+				if match:
+					level = len(match.group(1))
+					headings = {key: title for key, title in headings.items() if key < level}
+					headings[level] = match.group(2)
+		elif cell['cell_type'] == 'code':
+			cells.append((dict(headings), source))
+
+	return cells
+
+
+def to_python(source):
+	"""Comment out the IPython magics and shell commands, which plain Python cannot run."""
+	lines = []
+	for line in source.split('\n'):
+		if line.lstrip().startswith(('%', '!')):
+			line = '# ' + line
+		lines.append(line)
+	return '\n'.join(lines)
+
+
+def _assigned_names(source):
+	"""Return the names of the variables which the source assigns at the top level."""
+	try:
+		tree = ast.parse(to_python(source))
+	except SyntaxError:
+		return set()
+	names = set()
+	for node in tree.body:
+		targets = node.targets if isinstance(node, ast.Assign) else \
+			[node.target] if isinstance(node, (ast.AugAssign, ast.AnnAssign)) else []
+		for target in targets:
+			for element in ast.walk(target):
+				if isinstance(element, ast.Name):
+					names.add(element.id)
+	return names
+
+
+def run_cells(cells, namespace=None, overrides=None, name='notebook'):
+	"""
+	Execute the sources of the given (headings, source) cells one after another in namespace.
+	Each variable in overrides is set once, right after the first cell which defines it, so that it takes
+	precedence over the setting made in the notebook (e.g. the list of countries), but not over the values
+	the notebook assigns to it later. The variables no cell defines are set before the first cell.
+	Returns the namespace.
+	"""
+	if namespace is None:
+		namespace = {'__name__': '__main__'}
+	if overrides is None:
+		overrides = {}
+
+	defined = set()
+	for headings, source in cells:
+		defined.update(_assigned_names(source))
+	pending = {key: value for key, value in overrides.items() if key in defined}
+	namespace.update({key: value for key, value in overrides.items() if key not in defined})
+
+	for i, (headings, source) in enumerate(cells):
+		code = compile(to_python(source), '<{} cell {}>'.format(name, i), 'exec')
+		exec(code, namespace)
+		for key in [key for key in pending if key in _assigned_names(source)]:
+			namespace[key] = pending.pop(key)
+
+	return namespace
@@ -1,17 +1,17 @@
 import pandas as pd
 import numpy as np
-import fiona
-import cartopy.io.shapereader as shpreader
-import shapely.geometry as sgeom
-from shapely.prepared import prep
-from shapely.ops import unary_union
-import zipfile
 import os
+import time
+
+from .archives import extract, join_path
+from .instrumentation import instrumented, add_bytes_read
 
 class NUTSConverter(object):
 	"""docstring for NUTSConverter"""
-	def __init__(self, downloader, eu_mapping_files_directory_path):
+	def __init__(self, downloader, eu_mapping_files_directory_path, processes=1):
 		super(NUTSConverter, self).__init__()
+		# The number of processes used to assign NUTS codes by geocoordinates
+		self.processes = processes
 		self.country = None
 		self.downloader = downloader
 		self.postcode2nuts_df = None
@@ -39,6 +39,7 @@ class NUTSConverter(object):
 
 
 	def open_postcode2nuts(self, postcode2nuts_path):
+		add_bytes_read(os.path.getsize(postcode2nuts_path))
 		return pd.read_csv(postcode2nuts_path,
 			sep=';',
 			quotechar="'",
@@ -55,9 +56,11 @@ class NUTSConverter(object):
 		else:
 			raise ValueError('lau_name_type can only be "LATIN" or "NATIONAL", but is set to: ' + str(lau_name_type))
 
+		add_bytes_read(os.path.getsize(eurostat_eu_lau2nuts_path))
 		municipality2nuts_df = pd.read_excel(eurostat_eu_lau2nuts_path,
 			sheet_name=self.country,
-			usecols=[lau_name_column, 'LAU CODE', 'NUTS 3 CODE']
+			usecols=[lau_name_column, 'LAU CODE', 'NUTS 3 CODE'],
+			dtype={'LAU CODE' : str}
 		)
 		municipality2nuts_df.rename(columns={lau_name_column : 'municipality', 'LAU CODE' : 'municipality_code', 'NUTS 3 CODE' : 'NUTS3'},
 			inplace=True
@@ -67,13 +70,13 @@ class NUTSConverter(object):
 
 	def open_shapefile(self, eurostat_eu_shapefile_zip_path):
 		# Prepare the data for mapping geocoordinates (longitude, latitude) to NUTS-3 regions
-		with zipfile.ZipFile(eurostat_eu_shapefile_zip_path, 'r') as container_zip:
-			directory_path = os.path.dirname(eurostat_eu_shapefile_zip_path)
-			directory_path = os.path.join(directory_path, 'NUTS')
-			inner_zip_path = container_zip.extract('NUTS_RG_01M_2016_4326_LEVL_3.shp.zip', directory_path)
-			with zipfile.ZipFile(inner_zip_path, 'r') as nuts_zip:
-				nuts_zip.extractall(directory_path)
-				eurostat_eu_shapefile_path = os.path.join(directory_path, 'NUTS_RG_01M_2016_4326_LEVL_3.shp')
+		# The shapefile reader needs the files on disk, so extract them from the nested zip, unless that has been done already
+		directory_path = os.path.join(os.path.dirname(eurostat_eu_shapefile_zip_path), 'NUTS')
+		extract(join_path(eurostat_eu_shapefile_zip_path, 'NUTS_RG_01M_2016_4326_LEVL_3.shp.zip'), directory_path)
+		eurostat_eu_shapefile_path = os.path.join(directory_path, 'NUTS_RG_01M_2016_4326_LEVL_3.shp')
+
+		# Import cartopy only here, as it is slow to import
+		import cartopy.io.shapereader as shpreader
 
 		reader = shpreader.Reader(eurostat_eu_shapefile_path)
 		nuts3_regions = reader.records()
@@ -132,36 +135,38 @@ class NUTSConverter(object):
 	def nuts_from_municipality_code(self, data_df, municipality_code_column='municipality_code'):
 		return self.__from_municipality2nuts(data_df, municipality_code_column, 'municipality_code')
 
-	def __nuts_from_latlon(self, latitude, longitude, closest_approximation=False):
-		if pd.isnull(longitude) or pd.isnull(latitude):
-				return None
-		map_point = sgeom.Point(longitude, latitude)
-
-		for nuts3 in self.latlon2nuts[self.country]:
-			if nuts3.geometry.contains(map_point):
-				return nuts3.attributes['FID']
-
-		if closest_approximation:
-			minimal_distance = 1e12
-			closest_nuts = None
-			for nuts3 in self.latlon2nuts[self.country]:
-				distance = map_point.distance(nuts3.geometry)
-				if distance < minimal_distance:
-					minimal_distance = distance
-					closest_nuts = nuts3
-			return closest_nuts.attributes['FID']
-
-		return None
-
 	def nuts_from_latlon(self, data_df, latitude_column='lat', longitude_column='lon', closest_approximation=False):
 		mask = self.missing_nuts_mask(data_df)
-		data_df.loc[mask, 'NUTS3'] = data_df[mask].apply(lambda row: self.__nuts_from_latlon(row[latitude_column], row[longitude_column], closest_approximation), axis=1)
+		points = data_df.loc[mask, [latitude_column, longitude_column]]
+
+		# Many plants share their coordinates (e.g. the centroid of their postcode), so classify each point only once
+		latitude_codes, unique_latitudes = pd.factorize(points[latitude_column])
+		longitude_codes, unique_longitudes = pd.factorize(points[longitude_column])
+		# Code -1 stands for a missing coordinate, so shift the codes by one and append NaN to the unique values
+		width = len(unique_longitudes) + 1
+		codes, unique_keys = pd.factorize((latitude_codes + 1) * width + (longitude_codes + 1))
+		latitudes = np.append(np.asarray(unique_latitudes, dtype=float), np.nan)[unique_keys // width - 1]
+		longitudes = np.append(np.asarray(unique_longitudes, dtype=float), np.nan)[unique_keys % width - 1]
+		regions = self.latlon2nuts[self.country]
+
+		if self.processes > 1 and len(latitudes) >= MINIMAL_POINTS_PER_PROCESS * 2:
+			nuts3 = _classify_points_in_parallel_if_faster(regions, latitudes, longitudes, closest_approximation,
+				self.processes)
+		else:
+			nuts3 = _classify_points(regions, latitudes, longitudes, closest_approximation)
+
+		data_df.loc[mask, 'NUTS3'] = np.array(nuts3 + [None], dtype=object)[codes]
 		return data_df
 
+	@instrumented('nuts', country_argument='country', rows_argument='data_df')
 	def add_nuts_information(self, data_df, country, postcode2nuts_path,
 		lau_name_type = 'LATIN', postcode_column='postcode', municipality_column='municipality',
 		municipality_code_column='municipality_code', latitude_column = 'lat', longitude_column = 'lon',
 		how = ['latlon', 'postcode', 'municipality_code', 'municipality'], closest_approximation=False, verbose=False):
+		"""
+		Add the NUTS-1, 2 and 3 codes to data_df, using the methods in how in that order.
+		The codes are determined by geocoordinates in self.processes processes.
+		"""
 		self.country = country
 		
 		if 'municipality' in how or 'municipality_code' in how:
@@ -192,4 +197,102 @@ class NUTSConverter(object):
 
 		df.drop('NUTS3', axis='columns', inplace=True)
 
-		return df
\ No newline at end of file
+		return df
+
+
+# The points are classified in parallel only if each process gets at least so many of them
+MINIMAL_POINTS_PER_PROCESS = 1000
+
+# ... and if classifying them serially is estimated to take at least so many seconds. Starting the pool
+# from the notebook's large process took 2.9 s for 5,000 points which were classified serially in 0.44 s,
+# so the pool breaks even at about 4 s of serial work with 4 processes and at about 6 s with 2. The threshold
+# is above both, as the start-up time grows with the memory of the forked process and the serial time
+# is estimated from only SAMPLE_POINTS points.
+MINIMAL_SERIAL_SECONDS = 8
+
+# The number of points classified serially to estimate the serial time of the others
+SAMPLE_POINTS = 200
+
+# The NUTS-3 regions used by the worker processes, set before they are started
+_worker_regions = None
+
+
+def _nuts_from_point(regions, latitude, longitude, closest_approximation=False):
+	# Return the code of the NUTS-3 region containing the point, or of the closest region if closest_approximation is set
+	import shapely.geometry as sgeom
+
+	if pd.isnull(longitude) or pd.isnull(latitude):
+		return None
+	map_point = sgeom.Point(longitude, latitude)
+
+	for nuts3 in regions:
+		if nuts3.geometry.contains(map_point):
+			return nuts3.attributes['FID']
+
+	if closest_approximation:
+		minimal_distance = 1e12
+		closest_nuts = None
+		for nuts3 in regions:
+			distance = map_point.distance(nuts3.geometry)
+			if distance < minimal_distance:
+				minimal_distance = distance
+				closest_nuts = nuts3
+		return closest_nuts.attributes['FID']
+
+	return None
+
+
+def _classify_points(regions, latitudes, longitudes, closest_approximation):
+	return [_nuts_from_point(regions, latitude, longitude, closest_approximation)
+			for latitude, longitude in zip(latitudes, longitudes)]
+
+
+def _set_worker_regions(regions):
+	global _worker_regions
+	_worker_regions = regions
+
+
+def _classify_chunk(chunk):
+	latitudes, longitudes, closest_approximation = chunk
+	return _classify_points(_worker_regions, latitudes, longitudes, closest_approximation)
+
+
+def _classify_points_in_parallel_if_faster(regions, latitudes, longitudes, closest_approximation, processes):
+	# Classify the first points serially, and the others in parallel only if their serial time,
+	# estimated from that of the first ones, is at least MINIMAL_SERIAL_SECONDS
+	start = time.perf_counter()
+	nuts3 = _classify_points(regions, latitudes[:SAMPLE_POINTS], longitudes[:SAMPLE_POINTS], closest_approximation)
+	seconds_per_point = (time.perf_counter() - start) / max(len(nuts3), 1)
+	latitudes = latitudes[SAMPLE_POINTS:]
+	longitudes = longitudes[SAMPLE_POINTS:]
+
+	if seconds_per_point * len(latitudes) >= MINIMAL_SERIAL_SECONDS and \
+		len(latitudes) >= MINIMAL_POINTS_PER_PROCESS * 2:
+		return nuts3 + _classify_points_in_parallel(regions, latitudes, longitudes, closest_approximation, processes)
+	return nuts3 + _classify_points(regions, latitudes, longitudes, closest_approximation)
+
+
+def _classify_points_in_parallel(regions, latitudes, longitudes, closest_approximation, processes):
+	"""
+	Classify the points in chunks in worker processes. Only the coordinates are sent to the workers:
+	where processes can be forked, they inherit the regions, otherwise each worker receives them once at its start.
+	"""
+	import multiprocessing
+
+	# Several chunks per process, so that the processes finishing early take over the remaining work
+	number_of_chunks = min(processes * 4, max(1, len(latitudes) // MINIMAL_POINTS_PER_PROCESS))
+	chunks = [(latitude_chunk, longitude_chunk, closest_approximation) for latitude_chunk, longitude_chunk
+			  in zip(np.array_split(latitudes, number_of_chunks), np.array_split(longitudes, number_of_chunks))]
+
+	if 'fork' in multiprocessing.get_all_start_methods():
+		_set_worker_regions(regions)
+		try:
+			with multiprocessing.get_context('fork').Pool(processes) as pool:
+				results = pool.map(_classify_chunk, chunks, chunksize=1)
+		finally:
+			_set_worker_regions(None)
+	else:
+		with multiprocessing.Pool(processes, initializer=_set_worker_regions, initargs=(regions,)) as pool:
+			results = pool.map(_classify_chunk, chunks, chunksize=1)
+
+	return [nuts3 for result in results for nuts3 in result]
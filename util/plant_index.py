@@ -0,0 +1,276 @@
+"""
+In-memory index over the published power plant tables, for answering filter and aggregate queries
+(e.g. the solar capacity commissioned in NUTS-2 region DE21 between two dates, or all the plants in a bounding box)
+without scanning all the rows. The index can be saved to a directory and memory-mapped from it.
+
+	index = PlantIndex.from_csv('output/renewable_power_plants/2020-08-25/renewable_power_plants_EU.csv')
+	index.aggregate('electrical_capacity', nuts_2_region='DE21', energy_source_level_2='Solar',
+		commissioning_date=('2010-01-01', '2015-12-31'))
+	index.select(bbox=(47.5, 9.5, 48.5, 11.0))
+	index.save('plant_index')
+	index = PlantIndex.load('plant_index')
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# The columns with an inverted index (value -> plants)
+INDEXED_COLUMNS = [
+	'country', 'nuts_1_region', 'nuts_2_region', 'nuts_3_region',
+	'energy_source_level_1', 'energy_source_level_2', 'energy_source_level_3', 'technology', 'data_source'
+]
+
+# The columns with a sorted index, for range queries
+DATE_COLUMNS = ['commissioning_date', 'decommissioning_date']
+
+# The size of the cells of the spatial index, in degrees
+GRID_CELL_SIZE = 0.1
+
+# The number of cells in a row of the grid; it is larger than 360 / GRID_CELL_SIZE, so that a cell's id
+# (row * _GRID_WIDTH + column) orders the cells by their row first
+_GRID_WIDTH = 1 << 16
+
+
+class PlantIndex(object):
+	"""
+	The plants' columns are kept as arrays: numbers and dates as they are, strings as codes into their unique values.
+	On top of them, there are:
+	- an inverted index for each of the INDEXED_COLUMNS, with the positions of the plants grouped by value,
+	- a sorted index for each of the DATE_COLUMNS,
+	- a grid-bucket spatial index over lat/lon, with the positions of the plants grouped by grid cell.
+	"""
+	def __init__(self, arrays, uniques, indexes, number_of_rows):
+		super(PlantIndex, self).__init__()
+		# column -> numbers, dates or codes
+		self.arrays = arrays
+		# string column -> unique values
+		self.uniques = uniques
+		# name -> array of the index
+		self.indexes = indexes
+		self.number_of_rows = number_of_rows
+		self.__code_lookup = {column: {value: code for code, value in enumerate(values)}
+							  for column, values in uniques.items()}
+
+	@classmethod
+	def from_df(cls, df):
+		"""Build the index for the plants in df."""
+		arrays = {}
+		uniques = {}
+		for column in df.columns:
+			values = df[column]
+			if column in DATE_COLUMNS:
+				arrays[column] = pd.to_datetime(values, errors='coerce').values
+			elif pd.api.types.is_numeric_dtype(values) and pd.api.types.is_extension_array_dtype(values):
+				# The nullable integers (Int64) would be saved as pickled objects, so they are kept as floats
+				arrays[column] = values.astype(float).values
+			elif pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_any_dtype(values):
+				arrays[column] = values.values
+			else:
+				codes, column_uniques = pd.factorize(values)
+				arrays[column] = codes.astype(np.int32)
+				uniques[column] = np.asarray(column_uniques, dtype=object)
+
+		indexes = {}
+		for column in INDEXED_COLUMNS:
+			if column in uniques:
+				order, offsets = _group(arrays[column], len(uniques[column]))
+				indexes[column + '.order'] = order
+				indexes[column + '.offsets'] = offsets
+
+		for column in DATE_COLUMNS:
+			if column in arrays:
+				dates = arrays[column]
+				known = np.flatnonzero(~np.isnat(dates))
+				order = known[np.argsort(dates[known], kind='mergesort')]
+				indexes[column + '.order'] = order
+				indexes[column + '.sorted'] = dates[order]
+
+		if 'lat' in arrays and 'lon' in arrays:
+			cells = _cell_ids(arrays['lat'], arrays['lon'])
+			known = np.flatnonzero(cells >= 0)
+			order = known[np.argsort(cells[known], kind='mergesort')]
+			indexes['grid.order'] = order
+			indexes['grid.cells'] = cells[order]
+
+		return cls(arrays, uniques, indexes, df.shape[0])
+
+	@classmethod
+	def from_csv(cls, *paths):
+		"""Build the index for the plants in the given published csv files (e.g. renewable_power_plants_EU.csv)."""
+		dfs = []
+		for path in paths:
+			df = pd.read_csv(path, dtype={column: str for column in INDEXED_COLUMNS}, low_memory=False)
+			for column in DATE_COLUMNS:
+				if column in df.columns:
+					df[column] = pd.to_datetime(df[column], errors='coerce')
+			dfs.append(df)
+		df = pd.concat(dfs, sort=False, ignore_index=True) if len(dfs) > 1 else dfs[0]
+		return cls.from_df(df)
+
+	def save(self, directory_path):
+		"""Save the index to the directory as .npy files, which load() memory-maps."""
+		os.makedirs(directory_path, exist_ok=True)
+		for name, array in list(self.arrays.items()) + list(self.indexes.items()):
+			kind = 'column' if name in self.arrays else 'index'
+			np.save(os.path.join(directory_path, '{}.{}.npy'.format(kind, name)), array, allow_pickle=False)
+
+		metadata = {
+			'number_of_rows': self.number_of_rows,
+			'columns': list(self.arrays),
+			'indexes': list(self.indexes),
+			'uniques': {column: [None if pd.isnull(value) else str(value) for value in values]
+						for column, values in self.uniques.items()},
+		}
+		with open(os.path.join(directory_path, 'metadata.json'), 'w', encoding='utf-8') as f:
+			json.dump(metadata, f, ensure_ascii=False)
+
+	@classmethod
+	def load(cls, directory_path, mmap_mode='r'):
+		"""Load the index saved to the directory, memory-mapping the arrays unless mmap_mode is None."""
+		with open(os.path.join(directory_path, 'metadata.json'), encoding='utf-8') as f:
+			metadata = json.load(f)
+
+		def load_array(kind, name):
+			return np.load(os.path.join(directory_path, '{}.{}.npy'.format(kind, name)), mmap_mode=mmap_mode)
+
+		arrays = {column: load_array('column', column) for column in metadata['columns']}
+		indexes = {name: load_array('index', name) for name in metadata['indexes']}
+		uniques = {column: np.array(values, dtype=object) for column, values in metadata['uniques'].items()}
+		return cls(arrays, uniques, indexes, metadata['number_of_rows'])
+
+	def __positions_for_values(self, column, values):
+		# The positions of the plants whose column has one of the values, from the inverted index
+		if isinstance(values, str) or not hasattr(values, '__iter__'):
+			values = [values]
+		order = self.indexes[column + '.order']
+		offsets = self.indexes[column + '.offsets']
+		parts = []
+		for value in values:
+			code = self.__code_lookup[column].get(value)
+			if code is not None:
+				parts.append(order[offsets[code]:offsets[code + 1]])
+		if len(parts) == 0:
+			return np.array([], dtype=np.int64)
+		return np.sort(np.concatenate(parts))
+
+	def __positions_for_dates(self, column, date_range):
+		# The positions of the plants whose date is in [start, end] (either can be None), from the sorted index
+		start, end = date_range
+		sorted_dates = self.indexes[column + '.sorted']
+		first = 0 if start is None else np.searchsorted(sorted_dates, np.datetime64(pd.Timestamp(start)), side='left')
+		last = len(sorted_dates) if end is None else \
+			np.searchsorted(sorted_dates, np.datetime64(pd.Timestamp(end)), side='right')
+		return np.sort(self.indexes[column + '.order'][first:last])
+
+	def __positions_in_bbox(self, bbox):
+		# The positions of the plants in the bounding box (min_lat, min_lon, max_lat, max_lon), from the grid index
+		min_lat, min_lon, max_lat, max_lon = bbox
+		cells = self.indexes['grid.cells']
+		order = self.indexes['grid.order']
+		first_row, first_column = _cell(min_lat, min_lon)
+		last_row, last_column = _cell(max_lat, max_lon)
+
+		# The cells of each grid row form a contiguous range of the sorted cell ids
+		parts = []
+		for row in range(first_row, last_row + 1):
+			first = np.searchsorted(cells, row * _GRID_WIDTH + first_column, side='left')
+			last = np.searchsorted(cells, row * _GRID_WIDTH + last_column, side='right')
+			parts.append(order[first:last])
+		if len(parts) == 0:
+			return np.array([], dtype=np.int64)
+		candidates = np.concatenate(parts)
+
+		# Only the cells on the border of the box can contain plants outside it
+		lat = self.arrays['lat'][candidates]
+		lon = self.arrays['lon'][candidates]
+		inside = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+		return np.sort(candidates[inside])
+
+	def positions(self, bbox=None, **filters):
+		"""
+		Return the positions of the plants matching all the filters, sorted. A filter is:
+		- column=value or column=[values] for the INDEXED_COLUMNS,
+		- column=(start, end) for the DATE_COLUMNS, where either end can be None,
+		- bbox=(min_lat, min_lon, max_lat, max_lon).
+		"""
+		candidate_sets = []
+		if bbox is not None:
+			candidate_sets.append(self.__positions_in_bbox(bbox))
+		for column, condition in filters.items():
+			if column + '.offsets' in self.indexes:
+				candidate_sets.append(self.__positions_for_values(column, condition))
+			elif column + '.sorted' in self.indexes:
+				candidate_sets.append(self.__positions_for_dates(column, condition))
+			else:
+				raise ValueError('There is no index for column {}.'.format(column))
+
+		if len(candidate_sets) == 0:
+			return np.arange(self.number_of_rows)
+
+		# Intersect the smallest sets first
+		candidate_sets.sort(key=len)
+		result = candidate_sets[0]
+		for candidates in candidate_sets[1:]:
+			if len(result) == 0:
+				break
+			result = np.intersect1d(result, candidates, assume_unique=True)
+		return result
+
+	def count(self, bbox=None, **filters):
+		"""Return the number of the plants matching the filters."""
+		return len(self.positions(bbox=bbox, **filters))
+
+	def column(self, column, positions=None):
+		"""Return the values of the column for the plants at the positions (by default, all of them)."""
+		values = self.arrays[column]
+		if positions is not None:
+			values = values[positions]
+		if column in self.uniques:
+			# Code -1 stands for missing values
+			uniques = np.append(self.uniques[column], np.nan)
+			return uniques[values]
+		return np.asarray(values)
+
+	def select(self, columns=None, bbox=None, **filters):
+		"""Return the plants matching the filters as a dataframe, indexed by their positions in the table."""
+		positions = self.positions(bbox=bbox, **filters)
+		if columns is None:
+			columns = list(self.arrays)
+		return pd.DataFrame({column: self.column(column, positions) for column in columns},
+							index=positions, columns=columns)
+
+	def aggregate(self, value_column='electrical_capacity', by=None, function='sum', bbox=None, **filters):
+		"""
+		Aggregate value_column (e.g. sum the capacity) over the plants matching the filters.
+		If by is the name of a column, return the aggregates per value of that column as a series.
+		"""
+		positions = self.positions(bbox=bbox, **filters)
+		values = pd.Series(self.column(value_column, positions))
+		if by is None:
+			return getattr(values, function)()
+		return values.groupby(self.column(by, positions)).agg(function)
+
+
+def _group(codes, number_of_values):
+	# Return the positions sorted by code and the offsets of each code's positions in them
+	order = np.argsort(codes, kind='mergesort')
+	counts = np.bincount(codes[codes >= 0], minlength=number_of_values)
+	# The missing values (code -1) come first in order, so skip them
+	offsets = np.concatenate([[0], np.cumsum(counts)]) + np.count_nonzero(codes < 0)
+	return order, offsets
+
+
+def _cell(lat, lon):
+	return int(np.floor((lat + 90) / GRID_CELL_SIZE)), int(np.floor((lon + 180) / GRID_CELL_SIZE))
+
+
+def _cell_ids(lat, lon):
+	# The id of the grid cell of each plant, or -1 if the plant has no coordinates
+	lat = np.asarray(lat, dtype=float)
+	lon = np.asarray(lon, dtype=float)
+	known = ~np.isnan(lat) & ~np.isnan(lon)
+	rows = np.floor((np.where(known, lat, 0) + 90) / GRID_CELL_SIZE).astype(np.int64)
+	columns = np.floor((np.where(known, lon, 0) + 180) / GRID_CELL_SIZE).astype(np.int64)
+	return np.where(known, rows * _GRID_WIDTH + columns, -1)
@@ -0,0 +1,178 @@
+"""
+Declarative rule tables for classifying rows, e.g. standardizing the energy source and technology of the plants.
+
+A rule table maps the values of input columns to the values of output columns. It is evaluated only for the
+unique combinations of the input values, and the results are broadcast back to the rows, so its cost
+depends on the number of distinct combinations, not on the number of rows.
+
+Each rule has conditions on the input columns and the values it sets to the output columns. The rules are
+organized in groups, applied in the order in which they appear. Within a group, only the first rule whose
+conditions hold applies, like an if/elif chain. The later groups see the values set by the earlier ones.
+
+In a csv file, a rule table has the column group, a column if:<column> for each input and a column
+then:<column> for each output, e.g.:
+
+	group,if:energy_source_level_2,if:technology,then:technology
+	1,Marine|Geothermal|Bioenergy,,<missing>
+	1,Solar|Hydro,<missing>,Other or unspecified technology
+
+A condition lists the accepted values, separated by '|'; an empty condition accepts any value.
+An empty output leaves the column as it is. <missing> stands for the missing value in both.
+An output can refer to the values of the columns, as in {energy_source_level_2}_{technology};
+it is missing if any of them is.
+"""
+import string
+
+import numpy as np
+import pandas as pd
+
+MISSING = '<missing>'
+VALUE_SEPARATOR = '|'
+
+_formatter = string.Formatter()
+
+
+def _is_missing(value):
+	return value is None or (not isinstance(value, str) and pd.isnull(value))
+
+
+def _as_condition(values):
+	# Turn the accepted values into a set of strings, with MISSING for the missing value; None accepts any value
+	if values is None or (isinstance(values, str) and values == ''):
+		return None
+	if isinstance(values, str):
+		values = values.split(VALUE_SEPARATOR)
+	elif not isinstance(values, (list, tuple, set)):
+		values = [values]
+	return set(MISSING if _is_missing(value) else str(value) for value in values)
+
+
+def combination_codes(df, columns):
+	"""
+	Return the code of each row's combination of the values in the columns,
+	numbered in the order of their first appearance, and the positions of those first appearances.
+	"""
+	codes = np.zeros(df.shape[0], dtype=np.int64)
+	for column in columns:
+		column_codes, uniques = pd.factorize(df[column])
+		# Code -1 stands for the missing values, so shift the codes by one
+		codes, _ = pd.factorize(codes * (len(uniques) + 1) + column_codes + 1)
+	_, first_positions = np.unique(codes, return_index=True)
+	return codes, first_positions
+
+
+def apply_unique(df, function, columns=None):
+	"""
+	Like df.apply(function, axis=1), but evaluating the function only once for each unique combination
+	of the values in the columns (by default, all the columns of df). Returns a series indexed as df.
+	"""
+	if columns is None:
+		columns = list(df.columns)
+	codes, first_positions = combination_codes(df, columns)
+	combinations = df[columns].iloc[first_positions]
+	results = [function(row) for _, row in combinations.iterrows()]
+	values = np.empty(len(results), dtype=object)
+	values[:] = results
+	return pd.Series(values[codes], index=df.index).infer_objects()
+
+
+class RuleTable(object):
+	"""An ordered table of rules (see the module's docstring), evaluated on the unique input combinations."""
+	def __init__(self, rules):
+		"""
+		rules is a list of dictionaries with the keys 'if' (input column -> accepted value or list of values),
+		'then' (output column -> value; None for the missing value) and, optionally, 'group'.
+		"""
+		super(RuleTable, self).__init__()
+		self.rules = []
+		for rule in rules:
+			conditions = {column: _as_condition(values) for column, values in rule.get('if', {}).items()}
+			self.rules.append({
+				'group': rule.get('group', 0),
+				'if': {column: values for column, values in conditions.items() if values is not None},
+				'then': dict(rule.get('then', {})),
+			})
+
+		# The inputs are the columns the conditions and outputs refer to and the output columns themselves,
+		# whose values are kept where no rule sets them
+		self.inputs = []
+		self.outputs = []
+		for rule in self.rules:
+			referenced = list(rule['if'])
+			for value in rule['then'].values():
+				if isinstance(value, str):
+					referenced += [field for _, field, _, _ in _formatter.parse(value) if field]
+			for column in referenced + list(rule['then']):
+				if column not in self.inputs:
+					self.inputs.append(column)
+			for column in rule['then']:
+				if column not in self.outputs:
+					self.outputs.append(column)
+
+	@classmethod
+	def from_csv(cls, path):
+		"""Read a rule table from a csv file in the format described in the module's docstring."""
+		table = pd.read_csv(path, dtype=str, keep_default_na=False)
+		rules = []
+		for record in table.to_dict(orient='records'):
+			rule = {'group': record.get('group', ''), 'if': {}, 'then': {}}
+			for key, value in record.items():
+				if key.startswith('if:'):
+					rule['if'][key[3:]] = value
+				elif key.startswith('then:') and value != '':
+					rule['then'][key[5:]] = None if value == MISSING else value
+			rules.append(rule)
+		return cls(rules)
+
+	def __matches(self, rule, values):
+		for column, accepted in rule['if'].items():
+			value = values.get(column)
+			if (MISSING if _is_missing(value) else str(value)) not in accepted:
+				return False
+		return True
+
+	@staticmethod
+	def __output(value, values):
+		if not isinstance(value, str) or '{' not in value:
+			return value
+		fields = [field for _, field, _, _ in _formatter.parse(value) if field]
+		if any(_is_missing(values.get(field)) for field in fields):
+			return None
+		return value.format(**{field: values[field] for field in fields})
+
+	def evaluate_one(self, values):
+		"""Apply the rules to a dictionary of the input values and return the dictionary with the outputs set."""
+		values = dict(values)
+		group = None
+		applied = False
+		for rule in self.rules:
+			if rule['group'] != group:
+				group = rule['group']
+				applied = False
+			if applied or not self.__matches(rule, values):
+				continue
+			for column, value in rule['then'].items():
+				values[column] = self.__output(value, values)
+			applied = True
+		return values
+
+	def evaluate(self, df):
+		"""Return a dataframe of the output columns for the rows of df, indexed as df."""
+		inputs = [column for column in self.inputs if column in df.columns]
+		codes, first_positions = combination_codes(df, inputs)
+		combinations = df[inputs].iloc[first_positions].to_dict(orient='records')
+		results = [self.evaluate_one(combination) for combination in combinations]
+
+		outputs = {}
+		for column in self.outputs:
+			values = np.empty(len(results), dtype=object)
+			values[:] = [np.nan if _is_missing(result.get(column)) else result.get(column) for result in results]
+			outputs[column] = values[codes]
+		return pd.DataFrame(outputs, index=df.index, columns=self.outputs).infer_objects()
+
+	def apply(self, df):
+		"""Set the output columns of df (in place) to the results of the rules. Returns df."""
+		outputs = self.evaluate(df)
+		for column in self.outputs:
+			df[column] = outputs[column]
+		return df
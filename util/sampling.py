@@ -0,0 +1,123 @@
+"""
+Stratified samples of the original data, for running the whole pipeline on a small part of it,
+e.g. to check a change to a country's processing or to the exporters in minutes instead of hours.
+
+Each source is cut right after reading. Every row gets a pseudo-random number in [0, 1) from the hash
+of its key: the plant's id, if the source has one, or else all of its values. A row is in the sample
+if its number is below the fraction or if it is among the rows with the lowest numbers in its stratum,
+so that each stratum keeps at least its share of the rows, and at least one row. The strata are
+the combinations of the energy types and of the edge cases: the rows without coordinates, capacity
+or commissioning date, and the rows whose key is repeated (duplicates).
+
+The columns are recognized by the names to which the column translation list maps them. Since the numbers
+depend only on the keys, the sample is the same in every run, the duplicates are taken or left together,
+and a plant which several sources list under the same id (e.g. a TSO and BNetzA under its EEG key)
+is mostly taken from all of them or from none.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from .rules import combination_codes
+
+# The translated names of the columns which define the strata and the keys
+ENERGY_COLUMNS = ['energy_source_level_2', 'energy_source_level_3', 'technology', 'energy_type']
+COORDINATE_COLUMNS = ['lat', 'lon', 'utm_east', 'utm_north', 'sweref99tm_east', 'sweref99tm_north']
+CAPACITY_COLUMNS = ['electrical_capacity_kW', 'electrical_capacity']
+DATE_COLUMNS = ['commissioning_date']
+# In the order of preference; the key is the first of them present in the source
+ID_COLUMNS = ['eeg_id', 'bnetza_id', 'gsrn_id', 'uk_beis_id', 'EIC_code', 'wind_turbine_id', 'URE_id']
+
+
+def _normalized(name):
+	return re.sub(r'\s+', ' ', str(name)).strip()
+
+
+def _missing_all(df, columns):
+	# Whether all the columns are missing in each row
+	return df[columns].isnull().all(axis=1).values
+
+
+def sample_numbers(df, key_columns=None, seed=0):
+	"""
+	Return the pseudo-random number in [0, 1) of each row of df, from the hash of its values in key_columns
+	(by default, all of them). The rows without any value in key_columns are hashed by all their values.
+	"""
+	hash_key = '{:016d}'.format(seed % 10**16)
+	hashes = pd.util.hash_pandas_object(df, index=False, hash_key=hash_key).values.copy()
+	if key_columns:
+		keyed = ~_missing_all(df, key_columns)
+		key_hashes = pd.util.hash_pandas_object(df.loc[keyed, key_columns], index=False, hash_key=hash_key).values
+		hashes[keyed] = key_hashes
+	# The 53 high bits fill the mantissa of a double exactly
+	return (hashes >> np.uint64(11)).astype(np.float64) / 2.0**53
+
+
+def stratified_mask(numbers, strata, fraction):
+	"""
+	Return the mask of the rows in the sample: those whose number is below fraction
+	and, in each stratum (given by its code), the ceil(fraction * size) rows with the lowest numbers.
+	"""
+	order = np.lexsort((numbers, strata))
+	sizes = np.bincount(strata)
+	starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+	quotas = np.minimum(np.maximum(np.ceil(fraction * sizes).astype(np.int64), 1), sizes)
+	# The equal numbers at the threshold (duplicates) are all taken
+	thresholds = numbers[order[starts + quotas - 1]]
+	return (numbers < fraction) | (numbers <= thresholds[strata])
+
+
+class Sampler(object):
+	"""
+	Cuts the original data to the stratified samples described in the module's docstring.
+	With fraction None, the data are left whole.
+	"""
+	def __init__(self, fraction, translation_path, seed=0):
+		super(Sampler, self).__init__()
+		if fraction is not None and not 0 < fraction <= 1:
+			raise ValueError('The sample fraction must be in (0, 1], but is {}.'.format(fraction))
+		self.fraction = fraction
+		self.seed = seed
+		self.translation = pd.read_csv(translation_path, dtype=str, keep_default_na=False)
+
+	def __translated_columns(self, df, country, data_source):
+		# Map the translated names to the source's columns
+		rows = self.translation.loc[self.translation['country'] == country]
+		if data_source is not None:
+			rows = rows.loc[rows['data_source'] == data_source]
+		names = {_normalized(original): translated for original, translated in zip(rows['original_name'], rows['opsd_name'])}
+		columns = {}
+		for column in df.columns:
+			columns.setdefault(names.get(_normalized(column), column), []).append(column)
+		return columns
+
+	def mask(self, df, country, data_source=None):
+		"""Return the mask of the rows of df, read from the source of the country, which are in the sample."""
+		if self.fraction is None or self.fraction >= 1 or df.shape[0] == 0:
+			return np.ones(df.shape[0], dtype=bool)
+		columns = self.__translated_columns(df, country, data_source)
+
+		def present(names):
+			return [column for name in names for column in columns.get(name, [])]
+
+		id_columns = present(ID_COLUMNS)
+		numbers = sample_numbers(df, id_columns[:1], seed=self.seed)
+
+		strata = df[present(ENERGY_COLUMNS)].copy()
+		for name, names in [('missing_coordinates', COORDINATE_COLUMNS), ('missing_capacity', CAPACITY_COLUMNS),
+							('missing_date', DATE_COLUMNS)]:
+			if len(present(names)) > 0:
+				strata[name] = _missing_all(df, present(names))
+		strata['duplicated'] = pd.Series(numbers).duplicated(keep=False).values
+		codes, _ = combination_codes(strata, list(strata.columns))
+
+		mask = stratified_mask(numbers, codes, self.fraction)
+		print('Sampled {} of {} rows of {} {}'.format(mask.sum(), df.shape[0], country, data_source or ''))
+		return mask
+
+	def sample(self, df, country, data_source=None):
+		"""Return the sample of the rows of df, read from the source of the country, with a new index."""
+		if self.fraction is None or self.fraction >= 1:
+			return df
+		return df.loc[self.mask(df, country, data_source)].reset_index(drop=True)
@@ -0,0 +1,188 @@
+"""
+The dtype schema of the original data, from the columns dtype, categorical, nullable and date_format
+of the column translation list (input/column_translation_list.csv).
+
+The dtype of a column is one of:
+	string   - the values are read as strings, e.g. the postcodes and codes with leading zeros;
+	float    - the values are converted to floats;
+	integer  - the values are converted to integers (to the nullable Int64 if the column is nullable);
+	date     - the values are converted to dates, with date_format if it is given, else day first;
+or empty, if the dtype inferred by pandas is kept. The categorical string columns are read as categories;
+concatenate them with util.helper.concat_keeping_categories, as pd.concat turns them into objects otherwise.
+
+Only the strings and categories are set at read time (see Schema.read_dtypes), since a single value
+which does not fit them would make pandas fail on the whole file. The other columns are cast afterwards
+(see Schema.cast), which sets the values which do not fit to missing and reports them.
+
+	schema = Schema.from_translation_list(path, 'DE', 'BNetzA')
+	df = pd.read_excel(bnetza_filepath, dtype=schema.read_dtypes())
+	schema.cast(df)
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from .helper import apply_to_distinct_values
+
+DTYPES = ['string', 'float', 'integer', 'date']
+
+# The number of the failed values shown in the report, per column
+EXAMPLES = 3
+
+
+def _normalized(name):
+	# The column names are compared without the newlines and repeated whitespace, as in the translation
+	return re.sub(r'\s+', ' ', str(name)).strip()
+
+
+def _is_yes(value):
+	return isinstance(value, str) and value.strip().lower() in ['yes', 'true', '1']
+
+
+def _as_strings(series):
+	# Convert the non-missing values to strings, writing the integral floats without the decimals
+	def to_string(value):
+		if isinstance(value, float) and value.is_integer():
+			return str(int(value))
+		return str(value)
+	return apply_to_distinct_values(series, lambda uniques: [to_string(value) for value in uniques])
+
+
+def _to_integers(series, nullable):
+	# Convert the values to integers. Parsing only the present values keeps large integers exact,
+	# which a conversion through floats would not.
+	present = series.notnull().values
+	numbers = pd.to_numeric(series[present], errors='coerce')
+	integral = numbers.notnull().values & (numbers == np.floor(numbers)).values
+	values = np.zeros(series.shape[0], dtype=np.int64)
+	mask = np.zeros(series.shape[0], dtype=bool)
+	positions = np.flatnonzero(present)[integral]
+	values[positions] = numbers[integral].astype(np.int64).values
+	mask[positions] = True
+	if nullable:
+		result = pd.Series(pd.array(values, dtype='Int64'), index=series.index, name=series.name)
+		result[~mask] = np.nan
+		return result
+	if mask.all():
+		return pd.Series(values, index=series.index, name=series.name)
+	result = pd.Series(values.astype(float), index=series.index, name=series.name)
+	result[~mask] = np.nan
+	return result
+
+
+class Schema(object):
+	"""The dtypes of the columns of an original data source (see the module's docstring)."""
+	def __init__(self, columns):
+		"""
+		columns maps the original column names to dictionaries with the keys dtype, categorical, nullable
+		and date_format.
+		"""
+		super(Schema, self).__init__()
+		self.columns = {}
+		for name, spec in columns.items():
+			dtype = spec.get('dtype') or None
+			if dtype is not None and dtype not in DTYPES:
+				raise ValueError('Unknown dtype {} of the column {}.'.format(dtype, name))
+			self.columns[name] = {
+				'dtype': dtype,
+				'categorical': bool(spec.get('categorical')),
+				'nullable': bool(spec.get('nullable')),
+				'date_format': spec.get('date_format') or None,
+			}
+		self.__normalized_names = {_normalized(name): name for name in self.columns}
+		# The report of the last cast: the number and examples of the values which failed it, per column
+		self.report = pd.DataFrame(columns=['column', 'dtype', 'failed', 'examples'])
+
+	@classmethod
+	def from_translation_list(cls, path, country, data_source=None):
+		"""Read the schema of a country's columns (optionally of one source only) from the translation list."""
+		translation = pd.read_csv(path, dtype=str, keep_default_na=False)
+		rows = translation.loc[translation['country'] == country]
+		if data_source is not None:
+			rows = rows.loc[rows['data_source'] == data_source]
+		columns = {}
+		for record in rows.to_dict(orient='records'):
+			if record.get('dtype', '') == '':
+				continue
+			columns[record['original_name']] = {
+				'dtype': record['dtype'],
+				'categorical': _is_yes(record.get('categorical')),
+				'nullable': _is_yes(record.get('nullable')),
+				'date_format': record.get('date_format'),
+			}
+		return cls(columns)
+
+	def read_dtypes(self, exclude=()):
+		"""
+		Return the dtype argument for pandas' readers: str for the string columns and the dates with a format,
+		which are parsed by cast, and 'category' for the categorical ones. The columns in exclude
+		(e.g. those with converters) are left out.
+		"""
+		dtypes = {}
+		for name, spec in self.columns.items():
+			if name in exclude:
+				continue
+			if spec['dtype'] == 'string':
+				dtypes[name] = 'category' if spec['categorical'] else str
+			elif spec['dtype'] == 'date' and spec['date_format'] is not None:
+				dtypes[name] = str
+		return dtypes
+
+	def spec(self, column):
+		"""Return the specification of the column, or None if the schema has none."""
+		name = self.__normalized_names.get(_normalized(column))
+		return self.columns[name] if name is not None else None
+
+	def cast_column(self, series, spec):
+		"""Cast the series to the dtype of spec. Returns the cast series."""
+		dtype = spec['dtype']
+		if dtype == 'string':
+			if spec['categorical']:
+				if isinstance(series.dtype, pd.api.types.CategoricalDtype):
+					return series
+				return _as_strings(series).astype('category')
+			return series if series.dtype == object else _as_strings(series)
+		if dtype == 'float':
+			return series if pd.api.types.is_float_dtype(series) else pd.to_numeric(series, errors='coerce').astype(float)
+		if dtype == 'integer':
+			if pd.api.types.is_integer_dtype(series) and (series.dtype.name == 'Int64') == spec['nullable']:
+				return series
+			return _to_integers(series, spec['nullable'])
+		if dtype == 'date':
+			if pd.api.types.is_datetime64_any_dtype(series):
+				return series
+			# Numbers such as 20190101 are dates written without separators, not timestamps
+			values = series if series.dtype == object else _as_strings(series)
+			if spec['date_format'] is not None:
+				return pd.to_datetime(values, format=spec['date_format'], errors='coerce')
+			# All the sources write the day before the month
+			return pd.to_datetime(values, dayfirst=True, errors='coerce')
+		return series
+
+	def cast(self, df, verbose=True):
+		"""
+		Cast the columns of df (in place) to the dtypes of the schema and report the values which failed the cast,
+		i.e. were present before the cast and are missing after it. Returns df.
+		"""
+		rows = []
+		for column in df.columns:
+			spec = self.spec(column)
+			if spec is None or spec['dtype'] is None:
+				continue
+			before = df[column]
+			after = self.cast_column(before, spec)
+			failed = before.notnull().values & after.isnull().values
+			if failed.any():
+				examples = before[failed].drop_duplicates().head(EXAMPLES).tolist()
+				rows.append([column, spec['dtype'], int(failed.sum()), examples])
+			if after is not before:
+				df[column] = after
+
+		self.report = pd.DataFrame(rows, columns=['column', 'dtype', 'failed', 'examples'])
+		if verbose:
+			if self.report.empty:
+				print('All the values were cast to the schema.')
+			for column, dtype, failed, examples in rows:
+				print('\t{} values of {} failed the cast to {}, e.g. {}'.format(failed, column, dtype, examples))
+		return df
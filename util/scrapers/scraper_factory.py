@@ -1,5 +1,3 @@
-from .cz_eru_scraper import CZ_ERU_Scraper
-
 class ScraperFactory(object):
 	"""docstring for ScraperFactory"""
 	def __init__(self):
@@ -7,4 +5,6 @@ class ScraperFactory(object):
 
 	def getScraper(country, source_name, url):
 		if country == 'CZ' and source_name == 'ERU':
+			# Import the scraper only when it is needed, as it depends on bs4
+			from .cz_eru_scraper import CZ_ERU_Scraper
 			return CZ_ERU_Scraper(url)
\ No newline at end of file
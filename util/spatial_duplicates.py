@@ -0,0 +1,173 @@
+"""
+Detection of the plants which are probably reported twice, by different sources with slightly different data,
+so that neither the exact keys (R_1, R_8) nor drop_duplicates catch them.
+
+Two plants are a candidate pair if they have the same energy type, lie within max_distance_km of each other,
+their capacities differ by at most capacity_tolerance (relatively) and their commissioning dates by at most
+date_tolerance_days. Instead of comparing all the pairs, the plants are hashed into buckets of a grid over
+(latitude, longitude, log-capacity, commissioning date), with cells as large as the tolerances, per energy type.
+A plant can then only match the plants in its own bucket and the neighbouring ones, so the pairs are found
+in time roughly linear in the number of plants.
+
+The pairs are candidates for a review, not proven duplicates: where the coordinates are postcode centroids,
+small plants of the same type, size and age in one postcode area match as well.
+"""
+import numpy as np
+import pandas as pd
+
+from .instrumentation import instrumented
+
+EARTH_RADIUS_KM = 6371.0
+
+# The maximal number of the pairs compared at once, to bound the memory used
+MAX_PAIRS_PER_BATCH = 5 * 10**6
+
+PAIR_COLUMNS = ['index_1', 'index_2', 'data_source_1', 'data_source_2', 'distance_km',
+				'capacity_difference', 'date_difference_days', 'score']
+
+
+def _haversine(lat_1, lon_1, lat_2, lon_2):
+	# The great-circle distance in km
+	lat_1, lon_1, lat_2, lon_2 = [np.radians(values) for values in [lat_1, lon_1, lat_2, lon_2]]
+	a = np.sin((lat_2 - lat_1) / 2)**2 + np.cos(lat_1) * np.cos(lat_2) * np.sin((lon_2 - lon_1) / 2)**2
+	return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+def _half_neighbourhood(dimensions):
+	# The offsets to the neighbouring cells which are lexicographically greater than or equal to zero,
+	# so that each pair of neighbouring cells is visited from one side only
+	offsets = np.array(np.meshgrid(*[[-1, 0, 1]] * dimensions, indexing='ij')).reshape(dimensions, -1).T
+	nonzero = offsets != 0
+	first_nonzero = np.where(nonzero.any(axis=1), offsets[np.arange(len(offsets)), nonzero.argmax(axis=1)], 0)
+	return offsets[first_nonzero >= 0]
+
+
+def _bucket_keys(cells):
+	# Combine the cell coordinates (one column per dimension) into one integer key per plant, leaving a margin
+	# of one cell on each side, so that the key of a neighbouring cell is the key plus the offset times the strides
+	cells = cells - cells.min(axis=0) + 1
+	sizes = cells.max(axis=0) + 2
+	strides = np.concatenate([np.cumprod(sizes[::-1])[::-1][1:], [1]]).astype(np.int64)
+	return cells.dot(strides), strides
+
+
+def _pairs_with_offset(sorted_keys, order, keys, offset_key, same_bucket):
+	# Yield the candidate pairs (as arrays of positions) between each plant and the plants in the bucket
+	# whose key is the plant's key plus offset_key, in batches of at most MAX_PAIRS_PER_BATCH pairs
+	neighbour_keys = keys + offset_key
+	starts = np.searchsorted(sorted_keys, neighbour_keys, side='left')
+	ends = np.searchsorted(sorted_keys, neighbour_keys, side='right')
+	if same_bucket:
+		# Within a bucket, pair each plant only with the plants after it in the sorted order
+		ranks = np.empty(len(order), dtype=np.int64)
+		ranks[order] = np.arange(len(order))
+		starts = np.maximum(starts, ranks + 1)
+	counts = np.maximum(ends - starts, 0)
+
+	plants = np.flatnonzero(counts)
+	cumulative = np.cumsum(counts[plants])
+	batch_start = 0
+	while batch_start < len(plants):
+		already = cumulative[batch_start - 1] if batch_start > 0 else 0
+		batch_end = max(np.searchsorted(cumulative, already + MAX_PAIRS_PER_BATCH, side='right'), batch_start + 1)
+		batch = plants[batch_start:batch_end]
+		batch_counts = counts[batch]
+		first = np.repeat(batch, batch_counts)
+		# The position of each pair within its plant's range
+		within = np.arange(batch_counts.sum()) - np.repeat(np.cumsum(batch_counts) - batch_counts, batch_counts)
+		second = order[np.repeat(starts[batch], batch_counts) + within]
+		yield first, second
+		batch_start = batch_end
+
+
+@instrumented('spatial_duplicates', rows_argument='df')
+def find_candidates(df, max_distance_km=0.5, capacity_tolerance=0.1, date_tolerance_days=180, cross_source=True,
+					source_groups=None, energy_column='energy_source_level_2', capacity_column='electrical_capacity',
+					date_column='commissioning_date', source_column='data_source'):
+	"""
+	Find the candidate duplicate pairs in df (see the module's docstring). If cross_source,
+	only the plants from different sources are paired. source_groups maps sources to groups whose plants
+	are not paired with each other (e.g. the registers of one authority); the other sources are a group each.
+	The plants without coordinates, a positive capacity,
+	a commissioning date or an energy type are not paired.
+	Returns a dataframe of the pairs with the columns PAIR_COLUMNS, where index_1 and index_2 are
+	the index labels of the plants (index_1 being the plant earlier in df) and the score,
+	from 0 to 1, is higher the closer the plants' values are. The pairs are sorted by decreasing score.
+	"""
+	lat = pd.to_numeric(df['lat'], errors='coerce').values.astype(float)
+	lon = pd.to_numeric(df['lon'], errors='coerce').values.astype(float)
+	capacity = pd.to_numeric(df[capacity_column], errors='coerce').values.astype(float)
+	days = pd.to_datetime(df[date_column], errors='coerce').values.astype('datetime64[D]')
+	energy_codes, _ = pd.factorize(df[energy_column])
+	if source_column in df.columns:
+		sources = df[source_column]
+		if source_groups is not None:
+			sources = sources.map(source_groups).fillna(sources)
+		source_codes, _ = pd.factorize(sources)
+	else:
+		source_codes = np.zeros(df.shape[0], dtype=np.int64)
+
+	valid = ~np.isnan(lat) & ~np.isnan(lon) & (capacity > 0) & ~np.isnat(days) & (energy_codes >= 0)
+	positions = np.flatnonzero(valid)
+	pairs = pd.DataFrame(columns=PAIR_COLUMNS)
+	if len(positions) < 2:
+		return pairs
+	lat, lon, capacity, energy_codes, source_codes = \
+		[values[positions] for values in [lat, lon, capacity, energy_codes, source_codes]]
+	days = days[positions].astype(np.int64)
+
+	# Size the cells so that the plants within the tolerances are in the same or in neighbouring cells.
+	# A degree of longitude is shortest at the highest latitude, so the longitude cells are sized for it.
+	lat_cell_size = max_distance_km / (np.pi * EARTH_RADIUS_KM / 180)
+	lon_cell_size = lat_cell_size / max(np.cos(np.radians(min(np.abs(lat).max(), 89.0))), 1e-6)
+	log_capacity_cell_size = -np.log1p(-capacity_tolerance)
+	cells = np.column_stack([
+		energy_codes,
+		np.floor(lat / lat_cell_size),
+		np.floor(lon / lon_cell_size),
+		np.floor(np.log(capacity) / log_capacity_cell_size),
+		np.floor(days / float(max(date_tolerance_days, 1))),
+	]).astype(np.int64)
+	keys, strides = _bucket_keys(cells)
+	order = np.argsort(keys, kind='mergesort')
+	sorted_keys = keys[order]
+
+	# The energy type must match, so it is not a neighbouring dimension
+	found = []
+	for offset in _half_neighbourhood(cells.shape[1] - 1):
+		offset_key = int(np.dot(offset, strides[1:]))
+		for first, second in _pairs_with_offset(sorted_keys, order, keys, offset_key, offset_key == 0):
+			if cross_source:
+				different = source_codes[first] != source_codes[second]
+				first, second = first[different], second[different]
+			distance = _haversine(lat[first], lon[first], lat[second], lon[second])
+			capacity_difference = np.abs(capacity[first] - capacity[second]) / np.maximum(capacity[first],
+																							capacity[second])
+			date_difference = np.abs(days[first] - days[second])
+			match = (distance <= max_distance_km) & (capacity_difference <= capacity_tolerance) & \
+					(date_difference <= date_tolerance_days)
+			found.append((first[match], second[match], distance[match], capacity_difference[match],
+						  date_difference[match]))
+
+	if len(found) == 0:
+		return pairs
+	first, second, distance, capacity_difference, date_difference = \
+		[np.concatenate([part[i] for part in found]) for i in range(5)]
+	# Put the plant earlier in df first
+	first, second = positions[np.minimum(first, second)], positions[np.maximum(first, second)]
+	score = 1 - (distance / max_distance_km + capacity_difference / max(capacity_tolerance, 1e-9) +
+				 date_difference / float(max(date_tolerance_days, 1))) / 3
+
+	sources = df[source_column].values if source_column in df.columns else np.full(df.shape[0], np.nan)
+	pairs = pd.DataFrame({
+		'index_1': df.index.values[first],
+		'index_2': df.index.values[second],
+		'data_source_1': sources[first],
+		'data_source_2': sources[second],
+		'distance_km': distance,
+		'capacity_difference': capacity_difference,
+		'date_difference_days': date_difference,
+		'score': score,
+	}, columns=PAIR_COLUMNS)
+	return pairs.sort_values(['score', 'index_1', 'index_2'], ascending=[False, True, True]).reset_index(drop=True)
+
@@ -0,0 +1,56 @@
+import pandas as pd
+
+from .rules import RuleTable
+
+
+# The energy type of the timeseries is the level 2 energy source, and for wind also the technology
+ENERGY_TYPE_RULES = RuleTable([
+	{'if': {'energy_source_level_2': 'Wind'}, 'then': {'energy_type': '{energy_source_level_2}_{technology}'}},
+	{'then': {'energy_type': '{energy_source_level_2}'}},
+])
+
+def energy_types(df):
+	# Label the plants with the lowercase energy types; the plants without energy_source_level_2 get no label
+	labels = ENERGY_TYPE_RULES.evaluate(df)['energy_type'].astype(object)
+	return labels.str.lower().rename('energy_type')
+
+def min_date(series):
+	return pd.to_datetime(series, errors='coerce').min()
+
+def max_date(series):
+	return pd.to_datetime(series, errors='coerce').max()
+
+def to_daily_timeseries(df, start_date, end_date):
+	# Filter out missing dates
+	invalid_date_mask = pd.to_datetime(df['commissioning_date'], errors='coerce').isnull()
+	df = df.loc[~invalid_date_mask, :]
+
+	# Combine energy levels to new standardized values
+	labels = energy_types(df)
+
+	# Set range of time series as index
+	daily_timeseries = pd.DataFrame(index=pd.date_range(start=start_date, end=end_date, freq='D'))
+
+	# Create cumulated time series per energy source for both yearly and daily time series
+	for energy_type in labels.unique():
+		temp = (df[['commissioning_date', 'electrical_capacity']]
+			.loc[labels == energy_type])
+		temp_timeseries = temp.set_index('commissioning_date')
+		temp_timeseries.index = pd.DatetimeIndex(temp_timeseries.index)
+
+		# Create cumulated time series per energy_source and day
+		resampled = temp_timeseries.resample('D')
+		summed_by_day = resampled.sum()
+		cumulative_sums = summed_by_day.cumsum()
+
+		daily_timeseries[energy_type] = cumulative_sums.fillna(method='ffill') # fill missing values
+
+		# Make sure that the columns are properly filled
+		daily_timeseries[energy_type]= daily_timeseries[energy_type].fillna(method='ffill').fillna(value=0)
+
+	# Reset the time index
+	daily_timeseries.reset_index(inplace=True)
+
+	# Set the index name
+	daily_timeseries.rename(columns={'index': 'day'}, inplace=True)
+	return daily_timeseries
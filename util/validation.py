@@ -0,0 +1,37 @@
+# Define a function for extracting country-specific markers from the dictionary
+def get_markers(validation_markers, country):
+	markers = {}
+	for key in validation_markers:
+		if validation_markers[key]['Country'] == country:
+			short_explanation = validation_markers[key]['Short explanation']
+			long_explanation = validation_markers[key]['Long explanation']
+			marker_function = validation_markers[key]['function']
+
+			markers[key] = {'Short explanation' : short_explanation,
+							'Long explanation' : long_explanation,
+							'function' : marker_function}
+	return markers
+
+def mark(df, markers):
+	"""
+	Apply the marker functions to df and add the keys of the markers
+	that apply to a row to its column 'comment', separated by '|'.
+	"""
+	# Create an empty marker column
+	df['comment'] = ""
+
+	for key in markers:
+		# Extract the marker function
+		print('\t', key)
+		marker_function =  markers[key]['function']
+
+		# Mark the data
+		marked_mask = marker_function(df)
+
+		# Add the marker key to the comment column of the marked rows
+		df.loc[marked_mask, 'comment'] += (key + '|')
+
+		# Remove unnecessary variables which may be taking up a lot of memory
+		del marked_mask
+
+	return df
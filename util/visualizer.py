@@ -4,11 +4,94 @@ from cartopy.io import shapereader
 import geopandas
 import shapely
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.pyplot import figure
 import cartopy
+from matplotlib.colors import to_rgb
+from matplotlib.patches import Patch
 
-def visualize_points(latitudes, longitudes, country, categories=None, eps=0.03):
+# The Natural Earth country outlines, loaded once and reused by all the plots
+_countries_df = None
+
+def get_countries_df():
+	"""Return the Natural Earth admin_0_countries outlines, reading the shapefile only on the first call."""
+	global _countries_df
+	if _countries_df is None:
+		shp_filename = shapereader.natural_earth('10m', 'cultural', 'admin_0_countries')
+		_countries_df = geopandas.read_file(shp_filename)
+	return _countries_df
+
+def _cell_indices(values, minimum, maximum, number_of_cells):
+	# The index of the cell of each value on an axis divided into number_of_cells from minimum to maximum.
+	# The values below minimum get negative indices (floored, as a cast truncates those within a cell to 0),
+	# and maximum is put in the last cell. A zero range (a single point or points on a line) has a single
+	# position, put in the first cell.
+	if maximum > minimum:
+		indices = np.floor((values - minimum) / (maximum - minimum) * number_of_cells).astype(np.int64)
+		indices[values == maximum] = number_of_cells - 1
+		return indices
+	return np.where(values == minimum, 0, -1)
+
+def density_grids(latitudes, longitudes, extent, shape, categories=None):
+	"""
+	Count the points in each cell of a grid with the given shape (rows, columns)
+	covering extent = [min_lon, max_lon, min_lat, max_lat].
+	Returns the labels of the categories and an array of shape (number of labels, rows, columns)
+	with a count grid per category. All the points are binned in a single pass.
+	"""
+	min_lon, max_lon, min_lat, max_lat = extent
+	rows, columns = shape
+	latitudes = np.asarray(latitudes, dtype=float)
+	longitudes = np.asarray(longitudes, dtype=float)
+
+	if categories is None:
+		codes = np.zeros(len(latitudes), dtype=np.int64)
+		labels = [None]
+	else:
+		codes, labels = pd.factorize(np.asarray(categories))
+		labels = list(labels)
+
+	valid = ~(np.isnan(latitudes) | np.isnan(longitudes)) & (codes >= 0)
+	latitudes, longitudes, codes = latitudes[valid], longitudes[valid], codes[valid]
+
+	row = _cell_indices(latitudes, min_lat, max_lat, rows)
+	column = _cell_indices(longitudes, min_lon, max_lon, columns)
+	inside = (row >= 0) & (row < rows) & (column >= 0) & (column < columns)
+	cells = (codes[inside] * rows + row[inside]) * columns + column[inside]
+	counts = np.bincount(cells, minlength=len(labels) * rows * columns)
+
+	return labels, counts.reshape(len(labels), rows, columns)
+
+def _draw_density(ax, latitudes, longitudes, extent, shape, categories=None):
+	labels, grids = density_grids(latitudes, longitudes, extent, shape, categories=categories)
+	if categories is None:
+		colors = ['#123456']
+	else:
+		cycle = plt.rcParams['axes.prop_cycle'].by_key()['color']
+		colors = [cycle[i % len(cycle)] for i in range(len(labels))]
+
+	# Use logarithmic opacity, so that sparse areas stay visible next to dense ones
+	maximum = np.log1p(grids.max()) if grids.max() > 0 else 1
+	for grid, color in zip(grids, colors):
+		image = np.zeros(grid.shape + (4,))
+		image[:, :, :3] = to_rgb(color)
+		image[:, :, 3] = np.log1p(grid) / maximum
+		ax.imshow(image, origin='lower', extent=extent, transform=ccrs.PlateCarree(),
+			interpolation='nearest', zorder=2)
+
+	if categories is not None:
+		handles = [Patch(color=color, label=label) for label, color in zip(labels, colors)]
+		ax.legend(handles=handles)
+
+def visualize_points(latitudes, longitudes, country, categories=None, eps=0.03, mode='auto',
+	max_scatter_points=100000, grid_shape=(300, 400)):
+	"""
+	Show the locations on the map of the country.
+	mode can be 'scatter' (draw every point), 'density' (bin the points into a grid
+	of the given shape per category and draw the grids) or 'auto' (scatter at most
+	max_scatter_points points, otherwise draw the density).
+	"""
 	# Remove the locations not in Europe
 	european_latitude_mask = np.logical_and(latitudes >= 34, latitudes <= 81)
 	european_longitude_mask= np.logical_and(longitudes >= -31, longitudes <= 69)
@@ -20,6 +103,11 @@ def visualize_points(latitudes, longitudes, country, categories=None, eps=0.03):
 
 	if categories is not None:
 		categories = categories[european_mask]
+
+	if mode == 'auto':
+		mode = 'scatter' if len(latitudes) <= max_scatter_points else 'density'
+	elif mode not in ['scatter', 'density']:
+		raise ValueError('mode can only be "auto", "scatter" or "density", but is set to: ' + str(mode))
 		
 	# Determine the coordinates of boundary locations
 	max_lat = latitudes.max()
@@ -35,10 +123,8 @@ def visualize_points(latitudes, longitudes, country, categories=None, eps=0.03):
 	max_lon = max_lon + (max_lon - min_lon) * eps
 	min_lon = min_lon - (max_lon - min_lon) * eps
 	
-	# Get the shape file for visualizing countries
-	shp_filename = shapereader.natural_earth('10m', 'cultural', 'admin_0_countries')
-	
-	df_geo = geopandas.read_file(shp_filename)
+	# Get the country outlines
+	df_geo = get_countries_df()
 	
 	polygon = df_geo.loc[df_geo['ADMIN'] == country]['geometry'].values[0]
 
@@ -56,7 +142,10 @@ def visualize_points(latitudes, longitudes, country, categories=None, eps=0.03):
 
 	
 	# Plot the locations
-	if categories is None:
+	if mode == 'density':
+		_draw_density(ax, latitudes, longitudes, [min_lon, max_lon, min_lat, max_lat], grid_shape,
+			categories=categories)
+	elif categories is None:
 		ax.scatter(longitudes, latitudes, s=1.5, zorder=2, c='#123456')
 	else:
 		labels = categories.unique()
@@ -72,17 +161,16 @@ def visualize_points(latitudes, longitudes, country, categories=None, eps=0.03):
 	plt.show()
 
 
-def visualize_countries(countries):
+def visualize_countries(countries, dpi=100):
 	title = "Countries currently covered by the OPSD renewable power plants package:\n" + ", ".join(countries)
 
-	figure(num=None, figsize=(8, 8), dpi=1000, facecolor='white')
+	figure(num=None, figsize=(8, 8), dpi=dpi, facecolor='white')
 	ax = plt.axes(projection=ccrs.PlateCarree()) 
 	ax.add_feature(cartopy.feature.OCEAN, facecolor='#0C8FCE') 
 	ax.coastlines(resolution="10m", color="#FFFFFF")
 
-	# Get the shape file for visualizing countries
-	shp_filename = shapereader.natural_earth("10m", 'cultural', 'admin_0_countries')
-	df_geo = geopandas.read_file(shp_filename)
+	# Get the country outlines
+	df_geo = get_countries_df()
 
 	wider_european_region = shapely.geometry.Polygon([(-31, 34), (-31, 81), (69, 81), (69, 34)])
 	df_selected = df_geo[df_geo["geometry"].intersects(wider_european_region) & (df_geo["NAME"].isin(countries))]